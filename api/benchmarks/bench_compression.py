@@ -0,0 +1,169 @@
+"""Request-body compression and response serialization benchmarks.
+
+Measures, for checkout pages of realistic sizes, how small gzip and brotli
+make the /analyze_form upload, what encoding costs the client, and what
+RequestDecompressionMiddleware adds per request compared with an
+uncompressed body. Also compares the bytes the hash-first /analyze_form
+protocol uploads, and FastAPI's default response_model serialization with
+the model_dump_json path the routes use.
+
+Usage (from the `api` directory):
+    python -m benchmarks.bench_compression [--repeat 20]
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import time
+
+import brotli
+import httpx
+
+from benchmarks.bench_tools import report, timeit
+from benchmarks.stand_ins import checkout_html
+
+SIZES_KIB = (64, 256, 1024, 3072)
+
+
+def bench_ratios(pages, repeat: int) -> None:
+    print("checkout upload size and client-side encode time")
+    print(f"  {'page':>8}{'encoding':>12}{'wire KiB':>11}{'ratio':>8}{'encode ms':>12}")
+    for size_kib, body in pages.items():
+        encoders = {
+            "identity": lambda: body,
+            # CompressionStream("gzip") in the extension uses zlib's default level
+            "gzip-6": lambda: gzip.compress(body, compresslevel=6),
+            "gzip-9": lambda: gzip.compress(body, compresslevel=9),
+            "br-5": lambda: brotli.compress(body, quality=5),
+        }
+        for name, encode in encoders.items():
+            wire = encode()
+            stats = timeit(encode, max(1, repeat // 4))
+            print(f"  {size_kib:>6}Ki{name:>12}{len(wire) / 1024:11.1f}"
+                  f"{len(body) / len(wire):8.1f}{stats['median'] * 1000:12.2f}")
+
+
+def echo_app(max_bytes: int):
+    from fastapi import FastAPI
+    from discount_finder_langchain.compression import RequestDecompressionMiddleware
+    from discount_finder_langchain.schemas import HtmlAnalyzeRequest
+
+    app = FastAPI()
+
+    @app.post("/echo")
+    async def echo(request: HtmlAnalyzeRequest):
+        return {"length": len(request.html_page)}
+
+    app.add_middleware(RequestDecompressionMiddleware, max_bytes=max_bytes)
+    return app
+
+
+async def _post_timings(client: httpx.AsyncClient, body: bytes, headers: dict, repeat: int):
+    samples = []
+    for attempt in range(repeat + 1):
+        start = time.perf_counter()
+        resp = await client.post("/echo", content=body, headers=headers)
+        elapsed = time.perf_counter() - start
+        resp.raise_for_status()
+        if attempt:
+            samples.append(elapsed)
+    samples.sort()
+    return {"min": samples[0], "median": samples[len(samples) // 2], "max": samples[-1]}
+
+
+def bench_middleware(pages, repeat: int) -> None:
+    from discount_finder_langchain.config import config
+
+    app = echo_app(config.max_request_body_bytes)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                     base_url="http://bench") as client:
+            for size_kib, body in pages.items():
+                variants = {
+                    "identity": (body, {}),
+                    "gzip": (gzip.compress(body, compresslevel=6), {"Content-Encoding": "gzip"}),
+                    "br": (brotli.compress(body, quality=5), {"Content-Encoding": "br"}),
+                }
+                for name, (wire, headers) in variants.items():
+                    headers = {"Content-Type": "application/json", **headers}
+                    stats = await _post_timings(client, wire, headers, repeat)
+                    report(f"POST {size_kib} KiB checkout [{name}]", stats,
+                           f"{len(wire) // 1024} KiB on the wire")
+
+    print("\nRequestDecompressionMiddleware, in-process POST including JSON parsing")
+    asyncio.run(run())
+
+
+def bench_upload_protocol(repeat: int) -> None:
+    from discount_finder_langchain.html_store import apply_delta, html_digest, normalize_html
+    from discount_finder_langchain.schemas import HtmlDeltaOp
+
+    print("\n/analyze_form upload per protocol step, one cart price changed since the last visit")
+    print(f"  {'page':>8}{'full':>12}{'full gzip':>12}{'hash only':>12}{'delta':>10}"
+          f"{'normalize+hash ms':>20}{'apply delta ms':>16}")
+    for size_kib in SIZES_KIB:
+        base = normalize_html(checkout_html(size_kib * 1024))
+        at = base.index("$19.00")
+        page = base[:at] + "$21.00" + base[at + 6:]
+        digest = html_digest(page)
+        delta = [{"op": "=", "length": at}, {"op": "-", "length": 6},
+                 {"op": "+", "text": "$21.00"}, {"op": "=", "length": len(base) - at - 6}]
+        ops = [HtmlDeltaOp(**op) for op in delta]
+        full = json.dumps({"html_hash": digest, "html_page": page}).encode()
+        hash_only = json.dumps({"html_hash": digest}).encode()
+        delta_body = json.dumps({"html_hash": digest, "base_hash": html_digest(base),
+                                 "html_delta": delta}).encode()
+        hashing = timeit(lambda: html_digest(normalize_html(page)), repeat)
+        applying = timeit(lambda: apply_delta(base, ops), repeat)
+        print(f"  {size_kib:>6}Ki{len(full) / 1024:10.1f}Ki{len(gzip.compress(full)) / 1024:10.1f}Ki"
+              f"{len(hash_only):11d}B{len(delta_body):9d}B"
+              f"{hashing['median'] * 1000:20.2f}{applying['median'] * 1000:16.2f}")
+
+
+def bench_serialization(repeat: int) -> None:
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse, Response
+    from discount_finder_langchain.schemas import (
+        AnalyzeResponse,
+        FormAnalyzeResponse,
+        FormButton,
+        FormField,
+        FormFields,
+    )
+
+    models = {
+        "AnalyzeResponse[20 coupons]": AnalyzeResponse(coupons=[
+            {"code": f"SAVE{i:02d}", "source": "https://coupons.example/northwind"}
+            for i in range(20)]),
+        "FormAnalyzeResponse": FormAnalyzeResponse(form_fields=FormFields(
+            coupon_input=FormField(css_path="#checkout > form.discount input[name=code]"),
+            apply_button=FormButton(css_path="#checkout > form.discount button[type=submit]"))),
+    }
+    print("\nresponse serialization")
+    for name, model in models.items():
+        # What FastAPI does for a returned model: validate, encode, json.dumps
+        report(f"{name} [response_model]",
+               timeit(lambda: JSONResponse(jsonable_encoder(
+                   type(model).model_validate(model.model_dump()))), repeat * 50))
+        report(f"{name} [model_dump_json]",
+               timeit(lambda: Response(model.model_dump_json(),
+                                       media_type="application/json"), repeat * 50))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = {size: json.dumps({"html_page": checkout_html(size * 1024)}).encode()
+             for size in SIZES_KIB}
+    bench_ratios(pages, args.repeat)
+    bench_middleware(pages, args.repeat)
+    bench_upload_protocol(args.repeat)
+    bench_serialization(args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Image pipeline benchmarks: bytes downloaded, decode time and peak memory.
+
+Compares the previous pipeline (download `src`, full color decode, convert
+to grayscale) with srcset-aware selection and reduced grayscale decoding
+into a reused buffer.
+
+Usage (from the `api` directory):
+    python -m benchmarks.bench_images [--repeat 10]
+"""
+import argparse
+import tracemalloc
+
+from benchmarks.bench_tools import timeit
+from benchmarks.stand_ins import (
+    FakeOpenAIServer,
+    FixtureServer,
+    PROMO_IMAGES,
+    install_stand_ins,
+    load_fixture,
+    render_promo_image,
+)
+
+
+def legacy_process_image(image_content: bytes):
+    """The pipeline before reduced decoding, kept here as the baseline."""
+    import cv2
+    import numpy as np
+
+    img = cv2.imdecode(np.frombuffer(image_content, np.uint8), cv2.IMREAD_COLOR)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return cv2.adaptiveThreshold(
+        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+
+
+def peak_memory(func) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def legacy_src(img_tag) -> str:
+    return img_tag.get('src', '') or img_tag.get('data-src', '') or img_tag.get('data-lazy-src', '')
+
+
+def bench_selection(fixtures: FixtureServer) -> None:
+    import requests
+    from bs4 import BeautifulSoup
+    from discount_finder_langchain.utils import filter_image_by_size
+
+    home = load_fixture("merchant_home.html").replace("{base}", fixtures.url)
+    img_tags = BeautifulSoup(home, "html.parser").find_all("img")
+
+    def downloaded(urls):
+        total = 0
+        for url in urls:
+            resp = requests.get(url, headers={"Accept-Encoding": "identity"})
+            if resp.ok:
+                total += len(resp.content)
+        return total
+
+    legacy = [legacy_src(tag) for tag in img_tags
+              if legacy_src(tag).startswith(fixtures.url)]
+    selected = [url for url in (filter_image_by_size(tag, "127.0.0.1") for tag in img_tags)
+                if url and url.startswith(fixtures.url)]
+    print("image selection on merchant_home.html")
+    print(f"  src attribute     {len(legacy)} images {downloaded(legacy) / 1024:9.1f} KiB")
+    print(f"  srcset aware      {len(selected)} images {downloaded(selected) / 1024:9.1f} KiB")
+
+
+def bench_decode(repeat: int) -> None:
+    from discount_finder_langchain.ocr import LocalOcr
+    from discount_finder_langchain.utils import process_image_for_ocr
+
+    buffers = LocalOcr()
+    print("\ndecode and threshold per image")
+    print(f"  {'image':<26}{'KiB':>8}{'legacy ms':>12}{'new ms':>10}"
+          f"{'legacy peak':>14}{'new peak':>12}  output")
+    for name, (title, code, (width, height)) in PROMO_IMAGES.items():
+        for density in (1, 2, 3):
+            for ext in (".png", ".jpg"):
+                data = render_promo_image(
+                    title, code, (width * density, height * density), ext)
+                legacy = timeit(lambda: legacy_process_image(data), repeat)
+                new = timeit(lambda: process_image_for_ocr(
+                    data, allocate=buffers.image_buffer), repeat)
+                legacy_peak = peak_memory(lambda: legacy_process_image(data))
+                new_peak = peak_memory(lambda: process_image_for_ocr(
+                    data, allocate=buffers.image_buffer))
+                shape = process_image_for_ocr(data).shape
+                label = f"{name}@{density}x{ext}"
+                print(f"  {label:<26}{len(data) / 1024:8.0f}"
+                      f"{legacy['median'] * 1000:12.2f}{new['median'] * 1000:10.2f}"
+                      f"{legacy_peak / 2**20:11.1f} MiB{new_peak / 2**20:8.1f} MiB"
+                      f"  {shape[1]}x{shape[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with FixtureServer() as fixtures, FakeOpenAIServer() as openai:
+        install_stand_ins(fixtures, openai)
+        bench_selection(fixtures)
+        bench_decode(args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Microbenchmarks for the individual tool functions.
+
+Usage (from the `api` directory):
+    python -m benchmarks.bench_tools [--repeat 20] [--only NAME]
+"""
+import argparse
+import base64
+import statistics
+import time
+from typing import Callable, Dict
+
+from benchmarks.stand_ins import (
+    FakeOpenAIServer,
+    FixtureServer,
+    PROMO_IMAGES,
+    checkout_html,
+    install_stand_ins,
+    load_fixture,
+    render_promo_image,
+)
+
+
+def timeit(func: Callable[[], object], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "max": max(samples),
+    }
+
+
+def report(name: str, stats: Dict[str, float], extra: str = "") -> None:
+    print(f"{name:<34} min {stats['min'] * 1000:9.3f} ms"
+          f"  median {stats['median'] * 1000:9.3f} ms"
+          f"  max {stats['max'] * 1000:9.3f} ms  {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--only", default=None,
+                        help="run only benchmarks whose name contains this")
+    args = parser.parse_args()
+
+    with FixtureServer() as fixtures, FakeOpenAIServer() as openai:
+        install_stand_ins(fixtures, openai)
+
+        from bs4 import BeautifulSoup
+        from discount_finder_langchain.utils import (
+            fetch_url_content,
+            filter_image_by_size,
+            EMBEDDED_CODE_MATCHER,
+            process_image_for_ocr,
+        )
+        from discount_finder_langchain.tools import (
+            clean_html_tool_func,
+            search_coupons_from_web_func,
+        )
+
+        home = load_fixture("merchant_home.html").replace("{base}", fixtures.url)
+        img_tags = BeautifulSoup(home, "html.parser").find_all("img")
+        images = {name: render_promo_image(title, code, size)
+                  for name, (title, code, size) in PROMO_IMAGES.items()}
+        checkout = checkout_html(512 * 1024)
+        # Long word runs, which the embedded code pattern must scan in linear time
+        word_run = "a" * 50 * 1024
+        data_uri = ('<img src="data:image/png;base64,'
+                    + base64.b64encode(bytes(range(256)) * 6 * 1024).decode() + '">')
+
+        home_url = f"{fixtures.url}/merchant/"
+        benchmarks = {
+            "fetch_url_content[revalidate]": (
+                lambda: fetch_url_content(home_url),
+                "conditional GET against cached page"),
+            "filter_image_by_size": (
+                lambda: [filter_image_by_size(tag, "127.0.0.1") for tag in img_tags],
+                f"{len(img_tags)} tags"),
+            "search_coupons_from_web_func": (
+                lambda: search_coupons_from_web_func("northwind"),
+                f"{len(fixtures.coupon_sites)} local sites"),
+            "clean_html_tool_func": (
+                lambda: clean_html_tool_func(checkout, ["style", "script", "svg", "iframe"]),
+                f"{len(checkout) // 1024} KiB checkout"),
+        }
+        benchmarks["EMBEDDED_CODE_MATCHER[word run]"] = (
+            lambda: list(EMBEDDED_CODE_MATCHER.finditer(word_run)),
+            f"{len(word_run) // 1024} KiB word")
+        benchmarks["EMBEDDED_CODE_MATCHER[data uri]"] = (
+            lambda: list(EMBEDDED_CODE_MATCHER.finditer(data_uri)),
+            f"{len(data_uri) // 1024} KiB base64 image")
+        for name, data in images.items():
+            benchmarks[f"process_image_for_ocr[{name}]"] = (
+                lambda data=data: process_image_for_ocr(data),
+                f"{len(data) // 1024} KiB png")
+
+        for name, (func, extra) in benchmarks.items():
+            if args.only and args.only not in name:
+                continue
+            report(name, timeit(func, args.repeat), extra)
+
+
+if __name__ == "__main__":
+    main()
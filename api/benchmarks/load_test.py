@@ -0,0 +1,139 @@
+"""End-to-end load generator for the FastAPI app.
+
+By default the app runs in-process against the local stand-ins, so no
+network is needed. Pass --url to target an already running server instead.
+
+Usage (from the `api` directory):
+    python -m benchmarks.load_test --endpoint analyze --requests 50 --concurrency 8
+    python -m benchmarks.load_test --endpoint analyze_form --llm-latency 0.2
+"""
+import argparse
+import asyncio
+import contextlib
+import gzip
+import json
+import os
+import time
+from typing import List, Optional
+
+import httpx
+
+from benchmarks.stand_ins import FakeOpenAIServer, FixtureServer, checkout_html, install_stand_ins
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def has_result(endpoint: str, resp: httpx.Response) -> bool:
+    """Whether a 200 carries coupons or form fields, not just a valid empty body."""
+    try:
+        data = resp.json()
+    except ValueError:
+        return False
+    if endpoint == "analyze":
+        return bool(data.get("coupons"))
+    return bool(data.get("form_fields"))
+
+
+async def run_load(client: httpx.AsyncClient, endpoint: str, body: bytes, headers: dict,
+                   total: int, concurrency: int):
+    latencies: List[float] = []
+    statuses: dict = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    async def worker():
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                resp = await client.post(f"/{endpoint}", content=body, headers=headers)
+                status = resp.status_code
+                if status == 200 and not has_result(endpoint, resp):
+                    # Counted apart so a broken pipeline or stand-in cannot pass as all 200s
+                    status = "200 empty"
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - start
+
+
+def print_report(latencies: List[float], statuses: dict, elapsed: float) -> None:
+    print(f"requests      {len(latencies)}")
+    print(f"statuses      {statuses}")
+    print(f"elapsed       {elapsed:.2f} s")
+    print(f"throughput    {len(latencies) / elapsed if elapsed else 0:.2f} req/s")
+    for pct in (50, 95, 99):
+        print(f"p{pct:<12} {percentile(latencies, pct) * 1000:.1f} ms")
+
+
+async def main_async(args, target_url: Optional[str], payload: dict) -> None:
+    body = json.dumps(payload).encode()
+    headers = {"Content-Type": "application/json"}
+    if args.gzip:
+        body = gzip.compress(body)
+        headers["Content-Encoding"] = "gzip"
+    if target_url:
+        client = httpx.AsyncClient(base_url=target_url, timeout=args.timeout)
+    else:
+        from discount_finder_langchain.api import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                   base_url="http://bench", timeout=args.timeout)
+    async with client:
+        latencies, statuses, elapsed = await run_load(
+            client, args.endpoint, body, headers, args.requests, args.concurrency)
+    print_report(latencies, statuses, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", choices=("analyze", "analyze_form"), default="analyze")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.0,
+                        help="seconds the fake OpenAI server sleeps per call")
+    parser.add_argument("--site-latency", type=float, default=0.0,
+                        help="seconds the fixture server sleeps per request")
+    parser.add_argument("--merchant", choices=("images", "text"), default="images",
+                        help="fixture homepage with codes only in images or already in the HTML")
+    parser.add_argument("--html-kib", type=int, default=256,
+                        help="size of the checkout HTML sent to /analyze_form")
+    parser.add_argument("--result-cache", action="store_true",
+                        help="serve repeated requests from the result cache instead of re-running")
+    parser.add_argument("--gzip", action="store_true",
+                        help="send the /analyze_form body gzip-compressed")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--url", default=None,
+                        help="target a running server instead of the in-process app")
+    args = parser.parse_args()
+    os.environ["RESULT_CACHE"] = "1" if args.result_cache else "0"
+
+    with contextlib.ExitStack() as stack:
+        fixtures = stack.enter_context(FixtureServer(latency=args.site_latency))
+        openai = stack.enter_context(FakeOpenAIServer(latency=args.llm_latency))
+        install_stand_ins(fixtures, openai)
+
+        if args.endpoint == "analyze":
+            path = "merchant" if args.merchant == "images" else "merchant-text"
+            payload = {"url": f"{fixtures.url}/{path}/"}
+        else:
+            payload = {"html_page": checkout_html(args.html_kib * 1024)}
+        asyncio.run(main_async(args, args.url, payload))
+
+
+if __name__ == "__main__":
+    main()
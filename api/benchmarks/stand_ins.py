@@ -0,0 +1,342 @@
+"""Local stand-ins for the network services the pipeline talks to.
+
+`FixtureServer` serves recorded merchant homepages (codes only in images
+at /merchant/, codes in the HTML at /merchant-text/), coupon-site and
+checkout pages plus generated promo images. `FakeOpenAIServer` speaks enough of the
+OpenAI chat completions API to drive the planner, the executor agent and
+the tool LLM calls with canned responses. `install_stand_ins` points the
+package at both so benchmarks run without network access.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+# Text rendered into the generated promo images
+PROMO_IMAGES = {
+    "promo-banner": ("WINTER SALE", "CODE: WINTER25", (1200, 400)),
+    "promo-square": ("MEMBERS SAVE", "USE HIKER15", (600, 600)),
+    "promo-wide": ("FREE SHIPPING", "PROMO FREESHIP50", (960, 300)),
+}
+
+CANNED_COUPONS = [
+    {"code": "WINTER25", "source": "homepage banner"},
+    {"code": "FREESHIP50", "source": "homepage banner"},
+]
+
+CANNED_FORM_FIELDS = {
+    "coupon_input": {"css_path": "#discount-code"},
+    "apply_button": {"css_path": "#apply-discount"},
+}
+
+
+def load_fixture(name: str) -> str:
+    return (FIXTURES_DIR / name).read_text(encoding="utf-8")
+
+
+def render_promo_image(title: str, code: str, size=(1200, 400), ext: str = ".png") -> bytes:
+    """Render a promo banner with the given text and return encoded bytes."""
+    import cv2
+    import numpy as np
+
+    width, height = size
+    img = np.full((height, width, 3), (40, 90, 200), dtype=np.uint8)
+    scale = width / 600
+    thickness = max(2, int(scale * 2))
+    cv2.putText(img, title, (int(width * 0.06), int(height * 0.4)),
+                cv2.FONT_HERSHEY_SIMPLEX, scale, (255, 255, 255), thickness)
+    cv2.putText(img, code, (int(width * 0.06), int(height * 0.75)),
+                cv2.FONT_HERSHEY_SIMPLEX, scale, (255, 255, 0), thickness)
+    ok, encoded = cv2.imencode(ext, img)
+    if not ok:
+        raise RuntimeError("Failed to encode promo image")
+    return encoded.tobytes()
+
+
+def checkout_html(target_bytes: int = 0) -> str:
+    """Checkout page padded with cart line items up to roughly target_bytes."""
+    template = load_fixture("checkout.html")
+    row = ('<div class="line-item" data-sku="SKU-{i:05d}"><img src="/static/p/{i}.jpg" width="64" height="64">'
+           '<span class="name">Product {i} with a fairly long descriptive name</span>'
+           '<span class="qty">1</span><span class="price">$19.00</span></div>\n')
+    rows: List[str] = []
+    size = len(template)
+    i = 0
+    while i < 3 or size < target_bytes:
+        rows.append(row.format(i=i))
+        size += len(rows[-1])
+        i += 1
+    return template.replace("{line_items}", "".join(rows))
+
+
+class _ServerThread:
+    """Runs a ThreadingHTTPServer on a background thread."""
+
+    handler_class = BaseHTTPRequestHandler
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.httpd = ThreadingHTTPServer((host, port), self.handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.stand_in = self
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "_ServerThread":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _FixtureHandler(_QuietHandler):
+
+    def _send_page(self, body: bytes, content_type: str) -> None:
+        """Send with an ETag and gzip, answering revalidation with 304."""
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            encoding = "gzip"
+        else:
+            encoding = None
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("ETag", etag)
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server: FixtureServer = self.server.stand_in
+        if server.latency:
+            time.sleep(server.latency)
+        path = self.path.split("?", 1)[0]
+        server.hits[path] = server.hits.get(path, 0) + 1
+
+        if path in ("/", "/merchant", "/merchant/"):
+            body = load_fixture("merchant_home.html").replace(
+                "{base}", server.url)
+            return self._send_page(body.encode(), "text/html; charset=utf-8")
+        if path in ("/merchant-text", "/merchant-text/"):
+            body = load_fixture("merchant_home_text.html").replace(
+                "{base}", server.url)
+            return self._send_page(body.encode(), "text/html; charset=utf-8")
+        if match := re.match(r"^/coupons/([^/]+)/([^/]+)$", path):
+            body = load_fixture("coupon_site.html").replace(
+                "{merchant}", match.group(2))
+            return self._send_page(body.encode(), "text/html; charset=utf-8")
+        if path == "/checkout":
+            return self._send(200, checkout_html().encode(), "text/html; charset=utf-8")
+        if match := re.match(r"^/images/([\w-]+)(?:@(\d)x)?\.png$", path):
+            image = server.image(match.group(1), int(match.group(2) or 1))
+            if image is not None:
+                return self._send_page(image, "image/png")
+        self._send(404, b"not found", "text/plain")
+
+
+class FixtureServer(_ServerThread):
+    """Serves recorded pages and promo images from `fixtures/`."""
+
+    handler_class = _FixtureHandler
+
+    def __init__(self, *args, latency: float = 0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latency = latency
+        self.hits: Dict[str, int] = {}
+        self._images: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def image(self, name: str, density: int = 1) -> Optional[bytes]:
+        if name not in PROMO_IMAGES:
+            return None
+        key = f"{name}@{density}x"
+        with self._lock:
+            if key not in self._images:
+                title, code, (width, height) = PROMO_IMAGES[name]
+                self._images[key] = render_promo_image(
+                    title, code, (width * density, height * density))
+            return self._images[key]
+
+    @property
+    def coupon_sites(self) -> List[str]:
+        return [f"{self.url}/coupons/{site}/{{merchant_name}}"
+                for site in ("retailmenot", "promocodes", "coupons", "offers")]
+
+
+# FAKE OPENAI
+
+PLAN_ANALYZE = """Plan:
+1. Scrape images from the website homepage.
+2. Extract text from the scraped images.
+3. Extract coupon codes from the extracted text.
+4. Given the above steps taken, please respond to the users original question.
+<END_OF_PLAN>"""
+
+PLAN_FORM = """Plan:
+1. Extract the coupon form fields from the html.
+2. Given the above steps taken, please respond to the users original question.
+<END_OF_PLAN>"""
+
+
+def _agent_action(action: str, action_input) -> str:
+    payload = json.dumps({"action": action, "action_input": action_input})
+    return f"```json\n{payload}\n```"
+
+
+# The /analyze_form request input as it appears in planner and executor
+# prompts, unlike a bare "html:" it does not match the clean_html tool line
+FORM_INPUT = re.compile(r"""["']input["']: ["']html:""")
+
+
+def canned_completion(body: dict) -> str:
+    """Pick a canned completion for a chat request from the prompts it carries."""
+    messages = body.get("messages", [])
+    text = "\n".join(str(m.get("content", "")) for m in messages)
+    last = str(messages[-1].get("content", "")) if messages else ""
+
+    # Tool LLM calls ask for JSON output
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        if "coupon-related form elements" in text:
+            return json.dumps(CANNED_FORM_FIELDS)
+        return json.dumps({"coupons": CANNED_COUPONS})
+
+    # Planner
+    if "devise a plan" in text:
+        return PLAN_FORM if FORM_INPUT.search(text) else PLAN_ANALYZE
+
+    # Executor agent: call one tool per step, then finish the step
+    if "Observation:" in last:
+        observation = last.rsplit("Observation:", 1)[1].strip()
+        return _agent_action("Final Answer", observation[:2000])
+
+    step = re.search(r"Current objective:(.*)", last)
+    step = step.group(1).lower() if step else ""
+    if "scrape images" in step:
+        url = re.search(r"url: ([^\s'\"}]+)", text)
+        return _agent_action("scrape_some_images_from_website", {"url": url.group(1) if url else ""})
+    if "extract text" in step:
+        images = re.findall(r"https?://[^\s'\"\]]+\.png", text)
+        return _agent_action("extract_text_from_images", {"images": sorted(set(images))})
+    if "extract coupon" in step:
+        texts = re.findall(r"'text': '([^']*)'", text)
+        return _agent_action("extract_coupons_from_text", {"extracted_texts": [{"text": t} for t in texts]})
+    if "form fields" in step:
+        return _agent_action("extract_form_fields", {"html": "<form></form>"})
+    if FORM_INPUT.search(text):
+        return _agent_action("Final Answer", json.dumps({"form_fields": CANNED_FORM_FIELDS}))
+    return _agent_action("Final Answer", json.dumps({"coupons": CANNED_COUPONS}))
+
+
+class _FakeOpenAIHandler(_QuietHandler):
+
+    def do_POST(self):
+        server: FakeOpenAIServer = self.server.stand_in
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send(404, b'{"error": "not found"}', "application/json")
+
+        if server.latency:
+            time.sleep(server.latency)
+        server.calls += 1
+        content = server.responder(body)
+        prompt_tokens = sum(len(str(m.get("content", "")))
+                            for m in body.get("messages", [])) // 4
+        completion = {
+            "id": f"chatcmpl-bench-{server.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": prompt_tokens + len(content) // 4,
+            },
+        }
+        self._send(200, json.dumps(completion).encode(), "application/json")
+
+
+class FakeOpenAIServer(_ServerThread):
+    """OpenAI-compatible chat completions endpoint with configurable latency."""
+
+    handler_class = _FakeOpenAIHandler
+
+    def __init__(self, *args, latency: float = 0.0, responder=canned_completion, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latency = latency
+        self.responder = responder
+        self.calls = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.url}/v1"
+
+
+def install_stand_ins(fixtures: FixtureServer, openai: FakeOpenAIServer) -> None:
+    """Point the package at the local stand-ins.
+
+    Call before importing `discount_finder_langchain`, since the API key is
+    read at import time.
+    """
+    os.environ["OPENAI_API_KEY"] = "sk-bench"
+    os.environ["OPENAI_API_BASE"] = openai.base_url
+    os.environ["OPENAI_BASE_URL"] = openai.base_url
+    for var in ("HTTP_PROXY", "HTTPS_PROXY", "http_proxy", "https_proxy"):
+        os.environ.pop(var, None)
+    os.environ["NO_PROXY"] = "127.0.0.1,localhost"
+    # Keep benchmark pages, results and uploads out of the real caches
+    cache_dir = tempfile.mkdtemp(prefix="discount-finder-bench-")
+    os.environ.setdefault("HTTP_CACHE_DIR", os.path.join(cache_dir, "http"))
+    os.environ.setdefault("RESULT_CACHE_DIR", os.path.join(cache_dir, "results"))
+    os.environ.setdefault("HTML_STORE_DIR", os.path.join(cache_dir, "html"))
+
+    from discount_finder_langchain import constant
+    constant.COUPON_SITES[:] = fixtures.coupon_sites
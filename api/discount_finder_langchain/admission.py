@@ -0,0 +1,159 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from discount_finder_langchain.config import config
+from discount_finder_langchain.metrics import (
+    ADMISSION_ACTIVE,
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_SHED,
+    ADMISSION_WAIT_SECONDS,
+)
+
+
+# Lower runs first. Form analysis means the user is at checkout right now,
+# page analysis is speculative prefetching.
+PRIORITY_FORM = 0
+PRIORITY_ANALYZE = 1
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed instead of queued."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Server overloaded ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "endpoint", "future", "cancelled")
+
+    def __init__(self, priority: int, seq: int, endpoint: str, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.endpoint = endpoint
+        self.future = future
+        self.cancelled = False
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+    """Caps concurrent heavy pipelines and queues the rest by priority.
+
+    Only used from the event loop thread, so no locking is needed.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, max_wait: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.queued = 0
+        self._heap: List[_Waiter] = []
+        self._seq = itertools.count()
+        # Moving average of how long a slot is held, for Retry-After
+        self._avg_service = config.request_deadline_seconds / 2
+
+    def retry_after(self) -> int:
+        waves = (self.queued + 1) / max(1, self.max_concurrent)
+        return max(1, math.ceil(waves * self._avg_service))
+
+    def _update_gauges(self) -> None:
+        ADMISSION_ACTIVE.set(self.active)
+        ADMISSION_QUEUE_DEPTH.set(self.queued)
+
+    def _shed(self, reason: str, endpoint: str) -> Overloaded:
+        ADMISSION_SHED.inc(endpoint=endpoint, reason=reason)
+        return Overloaded(reason, self.retry_after())
+
+    async def acquire(self, priority: int, endpoint: str = "",
+                      max_wait: Optional[float] = None) -> None:
+        """Take a slot, queueing for at most max_wait or the configured wait."""
+        start = time.perf_counter()
+        if self.active < self.max_concurrent and not self.queued:
+            self.active += 1
+            self._update_gauges()
+            ADMISSION_WAIT_SECONDS.observe(0, endpoint=endpoint)
+            return
+
+        if self.queued >= self.max_queue and not self._evict(priority):
+            raise self._shed("queue_full", endpoint)
+
+        waiter = _Waiter(priority, next(self._seq), endpoint,
+                         asyncio.get_running_loop().create_future())
+        heapq.heappush(self._heap, waiter)
+        self.queued += 1
+        self._update_gauges()
+        try:
+            wait = self.max_wait if max_wait is None else min(self.max_wait, max_wait)
+            await asyncio.wait_for(asyncio.shield(waiter.future), wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                if waiter.future.exception() is not None:
+                    # Evicted just as we gave up, already counted as shed
+                    raise waiter.future.exception()
+                # The slot was handed over just as we gave up, pass it on
+                self.release()
+            else:
+                waiter.cancelled = True
+                waiter.future.cancel()
+                self.queued -= 1
+                self._update_gauges()
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._shed("wait_timeout", endpoint)
+            raise
+        ADMISSION_WAIT_SECONDS.observe(
+            time.perf_counter() - start, endpoint=endpoint)
+
+    def _evict(self, priority: int) -> bool:
+        """Shed the newest waiter of the lowest priority below `priority`, if any."""
+        queued = [waiter for waiter in self._heap if not waiter.cancelled]
+        if not queued:
+            return False
+        victim = max(queued)
+        if victim.priority <= priority:
+            return False
+        # Left in the heap, release() skips cancelled waiters
+        victim.cancelled = True
+        victim.future.set_exception(self._shed("evicted", victim.endpoint))
+        self.queued -= 1
+        self._update_gauges()
+        return True
+
+    def release(self, held_seconds: Optional[float] = None) -> None:
+        if held_seconds is not None:
+            self._avg_service = 0.8 * self._avg_service + 0.2 * held_seconds
+        while self._heap:
+            waiter = heapq.heappop(self._heap)
+            if waiter.cancelled:
+                continue
+            # Hand the slot straight to the next waiter, active stays the same
+            self.queued -= 1
+            waiter.future.set_result(None)
+            self._update_gauges()
+            return
+        self.active -= 1
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def slot(self, priority: int, endpoint: str = "", max_wait: Optional[float] = None):
+        await self.acquire(priority, endpoint, max_wait)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+
+admission = AdmissionController(
+    max_concurrent=config.max_concurrent_pipelines,
+    max_queue=config.admission_queue_size,
+    max_wait=config.admission_max_wait_seconds,
+)
@@ -8,6 +8,9 @@ from langchain_experimental.plan_and_execute import (
 from discount_finder_langchain.config import config
 from discount_finder_langchain.utils import create_agent_executor
 from discount_finder_langchain.prompts import SYSTEM_PROMPT
+from discount_finder_langchain.metrics import LLMMetricsHandler
+from discount_finder_langchain.deadline import current_budget, remaining_timeout
+from discount_finder_langchain.constant import LLM_TIMEOUT
 from langchain_openai import ChatOpenAI
 import os
 from dotenv import load_dotenv
@@ -20,17 +23,24 @@ def create_new_discount_finder_agent():
     planner_llm = ChatOpenAI(
         temperature=0,
         openai_api_key=OPENAI_API_KEY,
-        model="gpt-4o-mini"
+        model="gpt-4o-mini",
+        callbacks=[LLMMetricsHandler()],
+        timeout=remaining_timeout(LLM_TIMEOUT)
     )
     executor_llm = ChatOpenAI(
         temperature=0,
         openai_api_key=OPENAI_API_KEY,
-        model="gpt-4o-mini"
+        model="gpt-4o-mini",
+        callbacks=[LLMMetricsHandler()],
+        timeout=remaining_timeout(LLM_TIMEOUT)
     )
 
     planner = load_chat_planner(planner_llm, system_prompt=SYSTEM_PROMPT)
+    budget = current_budget()
     agent_executor = create_agent_executor(
-        executor_llm, all_tools, verbose=config.verbose, include_task_in_prompt=True)
+        executor_llm, all_tools, verbose=config.verbose, include_task_in_prompt=True,
+        max_iterations=config.max_agent_iterations,
+        max_execution_time=budget.remaining() if budget else None)
     agent = PlanAndExecute(
         planner=planner, executor=agent_executor, verbose=config.verbose, memory=None)
     return agent
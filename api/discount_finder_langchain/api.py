@@ -1,15 +1,102 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+import asyncio
+import logging
+import multiprocessing
+import os
+import secrets
+import time
 import uvicorn
+from discount_finder_langchain.compression import (
+    RequestDecompressionMiddleware,
+    ResponseCompressionMiddleware,
+)
+from discount_finder_langchain.config import config
+from discount_finder_langchain.metrics import REQUEST_SECONDS, start_trace, end_trace
 from discount_finder_langchain.routes import router
+from discount_finder_langchain.utils import vprint
+from discount_finder_langchain.ocr import close_ocr, serve_sidecar, warm_up_ocr
+from discount_finder_langchain.profiling import (
+    PROFILE_ID_HEADER,
+    begin_profile,
+    end_profile,
+    save_profile,
+    start_rolling_sampler,
+)
 
+logging.basicConfig(level=config.log_level, format="%(message)s")
+
+TRACE_HEADER = "X-Trace-Id"
 
 app = FastAPI()
 app.include_router(router)
+# Added before the trace middleware so it runs inside it and 413s are traced
+app.add_middleware(RequestDecompressionMiddleware, max_bytes=config.max_request_body_bytes)
+
+
+@app.on_event("startup")
+def load_ocr():
+    warm_up_ocr()
+
+
+@app.on_event("shutdown")
+def release_ocr():
+    close_ocr()
+
+
+@app.on_event("startup")
+def start_profiling():
+    start_rolling_sampler()
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    trace, token = start_trace(request.headers.get(TRACE_HEADER, "")[:64] or None)
+    profiling = None
+    if config.profiling_enabled:
+        profiling = begin_profile(request.headers, request.url.path, trace)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers[TRACE_HEADER] = trace.trace_id
+        if trace.stages:
+            response.headers["Server-Timing"] = trace.server_timing()
+        if profiling is not None:
+            response.headers[PROFILE_ID_HEADER] = profiling[0].profile_id
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        if profiling is not None:
+            profile, profile_token = profiling
+            end_profile(profile_token)
+            await asyncio.to_thread(save_profile, profile, elapsed)
+        # Label by route template, raw paths from scanners would grow series without bound
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(elapsed, path=route.path if route is not None else "unmatched",
+                                status=status)
+        vprint("trace=%s path=%s status=%s seconds=%.3f stages=%s counters=%s",
+               trace.trace_id, request.url.path, status, elapsed,
+               trace.stages, trace.counters, level=logging.DEBUG)
+        end_trace(token)
+
+
+# Outermost, so trace headers and ETags are set before the body is encoded
+app.add_middleware(ResponseCompressionMiddleware)
 
 
 def main():
+    if config.ocr_mode == "sidecar":
+        if not config.ocr_authkey:
+            # Set before the sidecar and workers start, both read it from the environment
+            os.environ["OCR_AUTHKEY"] = secrets.token_hex(32)
+            config.ocr_authkey = os.environ["OCR_AUTHKEY"].encode()
+        # One process holds the OCR model, workers reach it over a unix socket
+        sidecar = multiprocessing.Process(
+            target=serve_sidecar, name="ocr-sidecar", daemon=True)
+        sidecar.start()
     uvicorn.run("discount_finder_langchain.api:app",
-                host="0.0.0.0", port=8000, workers=4, loop="asyncio")
+                host="0.0.0.0", port=8000, workers=config.workers, loop="asyncio")
 
 
 if __name__ == "__main__":
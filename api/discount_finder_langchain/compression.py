@@ -0,0 +1,215 @@
+import asyncio
+import gzip
+import zlib
+from typing import List, Optional
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from discount_finder_langchain.constant import BROTLI_QUALITY, COMPRESS_MIN_BYTES, GZIP_LEVEL
+from discount_finder_langchain.metrics import BODY_BYTES
+
+# Encodings we produce, in order of preference
+RESPONSE_ENCODINGS = ("br", "gzip")
+
+
+class BodyTooLarge(Exception):
+    """Request body, decoded, is over the configured cap."""
+
+
+class UnsupportedEncoding(Exception):
+    """Request Content-Encoding we cannot decode."""
+
+
+def _inflate(decoder, body: bytes, max_bytes: int) -> bytes:
+    decoded = decoder.decompress(body, max_bytes + 1)
+    if len(decoded) > max_bytes:
+        raise BodyTooLarge(f"Decoded body exceeds {max_bytes} bytes")
+    if not decoder.eof:
+        raise zlib.error("Truncated compressed body")
+    return decoded
+
+
+def _unbrotli(body: bytes, max_bytes: int) -> bytes:
+    decoder = brotli.Decompressor()
+    decoded = decoder.process(body, output_buffer_limit=max_bytes + 1)
+    if len(decoded) > max_bytes or not decoder.can_accept_more_data():
+        raise BodyTooLarge(f"Decoded body exceeds {max_bytes} bytes")
+    if not decoder.is_finished():
+        raise brotli.error("Truncated compressed body")
+    return decoded
+
+
+def decode_body(body: bytes, encoding: str, max_bytes: int) -> bytes:
+    """Decode a gzip, deflate or br body without inflating past max_bytes."""
+    if encoding in ("gzip", "x-gzip"):
+        return _inflate(zlib.decompressobj(16 + zlib.MAX_WBITS), body, max_bytes)
+    if encoding == "deflate":
+        return _inflate(zlib.decompressobj(), body, max_bytes)
+    if encoding == "br":
+        return _unbrotli(body, max_bytes)
+    raise UnsupportedEncoding(encoding)
+
+
+def encode_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the preferred response encoding the client accepts, if any."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    for encoding in RESPONSE_ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class RequestDecompressionMiddleware:
+    """Decodes compressed request bodies and caps body size.
+
+    The whole body is read up front, which every endpoint does anyway to
+    parse its JSON. Bodies over max_bytes get a 413 whether they were sent
+    compressed or not, and large decodes run off the event loop.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        encoding = headers.get("content-encoding", "identity").strip().lower()
+        length = headers.get("content-length", "")
+        if length.isdigit() and int(length) > self.max_bytes:
+            await self._reject(scope, receive, send, 413, "Request body too large")
+            return
+        if encoding == "identity" and length.isdigit():
+            # Nothing to decode and the size is already known to be allowed
+            await self.app(scope, receive, send)
+            return
+
+        chunks: List[bytes] = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            more_body = message.get("more_body", False)
+            if size > self.max_bytes:
+                await self._reject(scope, receive, send, 413, "Request body too large")
+                return
+        body = b"".join(chunks)
+
+        if encoding != "identity":
+            try:
+                decoded = await asyncio.to_thread(decode_body, body, encoding, self.max_bytes)
+            except UnsupportedEncoding:
+                await self._reject(scope, receive, send, 415, f"Unsupported Content-Encoding: {encoding}")
+                return
+            except BodyTooLarge:
+                await self._reject(scope, receive, send, 413, "Request body too large")
+                return
+            except (zlib.error, brotli.error):
+                await self._reject(scope, receive, send, 400, "Malformed compressed request body")
+                return
+            BODY_BYTES.inc(len(body), direction="request", encoding=encoding, layer="wire")
+            BODY_BYTES.inc(len(decoded), direction="request", encoding=encoding, layer="decoded")
+            body = decoded
+
+        # Updated in place, outer middleware reads the matched route from this scope
+        scope["headers"] = [
+            (name, value) for name, value in scope["headers"]
+            if name not in (b"content-encoding", b"content-length")
+        ] + [(b"content-length", str(len(body)).encode())]
+
+        replayed = False
+
+        async def replay() -> Message:
+            nonlocal replayed
+            if replayed:
+                return await receive()
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        await self.app(scope, replay, send)
+
+    @staticmethod
+    async def _reject(scope: Scope, receive: Receive, send: Send, status: int, detail: str) -> None:
+        await JSONResponse({"detail": detail}, status_code=status)(scope, receive, send)
+
+
+class ResponseCompressionMiddleware:
+    """Encodes response bodies with br or gzip, whichever the client prefers.
+
+    Bodies are buffered, which suits the small JSON and metrics responses
+    this API sends. Strong ETags get an encoding suffix so every
+    representation keeps its own validator.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        chunks: List[bytes] = []
+
+        async def buffered_send(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body" and start is not None:
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    await self._send_encoded(send, start, b"".join(chunks), encoding)
+            else:
+                await send(message)
+
+        await self.app(scope, receive, buffered_send)
+
+    async def _send_encoded(self, send: Send, start: Message, body: bytes, encoding: str) -> None:
+        headers = MutableHeaders(scope=start)
+        if (len(body) >= self.minimum_size and "content-encoding" not in headers
+                and start["status"] not in (204, 304)):
+            encoded = encode_body(body, encoding)
+            if len(encoded) < len(body):
+                BODY_BYTES.inc(len(body), direction="response", encoding=encoding, layer="decoded")
+                BODY_BYTES.inc(len(encoded), direction="response", encoding=encoding, layer="wire")
+                body = encoded
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/") and etag.endswith('"'):
+                    headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+        headers.add_vary_header("Accept-Encoding")
+        await send(start)
+        await send({"type": "http.response.body", "body": body})
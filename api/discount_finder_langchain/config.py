@@ -1,7 +1,70 @@
+import os
 
 
 class Config:
     verbose = True
+    # Logging level for vprint output, DEBUG shows raw agent responses
+    log_level = os.getenv("LOG_LEVEL", "INFO" if verbose else "WARNING")
+
+    # Request budget, clients may ask for a shorter deadline but not a longer one
+    request_deadline_seconds = float(
+        os.getenv("REQUEST_DEADLINE_SECONDS", "25"))
+    # Stop the run once this many validated coupons are found
+    early_stop_coupons = int(os.getenv("EARLY_STOP_COUPONS", "5"))
+    # Cap on plan-and-execute steps and on agent iterations per step
+    max_plan_steps = int(os.getenv("MAX_PLAN_STEPS", "6"))
+    max_agent_iterations = int(os.getenv("MAX_AGENT_ITERATIONS", "6"))
+
+    # Admission control, per worker
+    max_concurrent_pipelines = int(os.getenv("MAX_CONCURRENT_PIPELINES", "2"))
+    admission_queue_size = int(os.getenv("ADMISSION_QUEUE_SIZE", "16"))
+    admission_max_wait_seconds = float(
+        os.getenv("ADMISSION_MAX_WAIT_SECONDS", "10"))
+
+    # Deployment
+    workers = int(os.getenv("WORKERS", "4"))
+    # "local" loads EasyOCR in every worker, "sidecar" shares one model per node
+    ocr_mode = os.getenv("OCR_MODE", "local")
+    ocr_socket = os.getenv("OCR_SOCKET", "/tmp/discount_finder_ocr.sock")
+    # Generated at startup when unset, workers inherit it through the environment
+    ocr_authkey = os.getenv("OCR_AUTHKEY", "").encode()
+    # Models the sidecar loads, each one more image OCR'd at a time and one more model in memory
+    ocr_readers = int(os.getenv("OCR_READERS", "1"))
+
+    # On-disk HTTP cache for merchant pages, coupon sites and images
+    http_cache_enabled = os.getenv("HTTP_CACHE", "1") != "0"
+    http_cache_dir = os.getenv(
+        "HTTP_CACHE_DIR", os.path.expanduser("~/.cache/discount_finder/http"))
+    http_cache_max_bytes = int(
+        os.getenv("HTTP_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+    # Finished /analyze and /analyze_form results, served and revalidated by ETag
+    result_cache_enabled = os.getenv("RESULT_CACHE", "1") != "0"
+    result_cache_seconds = int(os.getenv("RESULT_CACHE_SECONDS", str(24 * 60 * 60)))
+    result_cache_dir = os.getenv(
+        "RESULT_CACHE_DIR", os.path.expanduser("~/.cache/discount_finder/results"))
+    result_cache_max_bytes = int(
+        os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    # Normalized pages uploaded to /analyze_form, for hash-only requests and deltas
+    html_store_dir = os.getenv(
+        "HTML_STORE_DIR", os.path.expanduser("~/.cache/discount_finder/html"))
+    html_store_max_bytes = int(
+        os.getenv("HTML_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+    # Request bodies are rejected past this size, measured after decompression
+    max_request_body_bytes = int(
+        os.getenv("MAX_REQUEST_BODY_BYTES", str(16 * 1024 * 1024)))
+
+    # Opt-in profiling, X-Profile requests and /admin/profile* need PROFILING_TOKEN
+    profiling_enabled = os.getenv("PROFILING", "0") == "1"
+    profiling_token = os.getenv("PROFILING_TOKEN", "")
+    profile_dir = os.getenv(
+        "PROFILE_DIR", os.path.expanduser("~/.cache/discount_finder/profiles"))
+    # Per-request profiles kept, and the stack sampling interval for X-Profile: sample
+    profile_keep = int(os.getenv("PROFILE_KEEP", "32"))
+    profile_interval_seconds = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.005"))
+    # Rolling sampler over all threads for flame graphs, 0 turns it off
+    profile_sample_hz = float(os.getenv("PROFILE_SAMPLE_HZ", "19"))
+    profile_window_minutes = int(os.getenv("PROFILE_WINDOW_MINUTES", "15"))
 
 
 config = Config()
@@ -1,12 +1,31 @@
 
-# Coupon code patterns
-CODE_PATTERNS = [
+# Coupon code patterns anchored on a keyword, precise enough for whole-page text
+KEYWORD_CODE_PATTERNS = [
     r'code[:\s]+([A-Z0-9-_]+)',
     r'coupon[:\s]+([A-Z0-9-_]+)',
     r'promo[:\s]+([A-Z0-9-_]+)',
+]
+
+# Explicit code anchors, strong enough to accept a candidate without a digit
+ANCHORED_CODE_PATTERNS = [
+    r'code\s*:\s*([A-Z0-9-_]+)',
+    r'use\s+code\s+([A-Z0-9-_]+)',
+]
+
+# Coupon code patterns
+CODE_PATTERNS = KEYWORD_CODE_PATTERNS + [
     r'\b([A-Z0-9]{4,15})\b'
 ]
 
+# Coupon codes in embedded JSON or JS state, e.g. "couponCode": "SAVE10".
+# The key starts at a word boundary, an unanchored \w* backtracks
+# quadratically on long word runs such as inline base64 data URIs.
+EMBEDDED_CODE_PATTERN = r'["\']?((?<!\w)\w*(?:coupon|promo|voucher|discount)_?code\w*)["\']?\s*:\s*["\']([A-Za-z0-9_-]{4,15})["\']'
+
+# Words the keyword patterns pick up that are never codes
+NON_CODE_WORDS = ['CODE', 'CODES', 'COUPON', 'COUPONS', 'PROMO', 'APPLY', 'APPLIED',
+                  'HERE', 'NEEDED', 'REQUIRED', 'BELOW', 'ABOVE', 'WITH', 'FROM', 'VALID']
+
 
 # Coupon element selectors
 COUPON_SELECTORS = [
@@ -22,6 +41,9 @@ COUPON_SELECTORS = [
 
 # Coupon data attributes
 COUPON_ATTRIBUTES = ['data-coupon', 'data-code', 'data-promo']
+# Attributes also used for language, currency or product codes, only trusted
+# on or inside an element matching COUPON_SELECTORS
+GENERIC_COUPON_ATTRIBUTES = ['data-code']
 
 # Coupon sites template URLs
 COUPON_SITES = [
@@ -39,6 +61,12 @@ USER_AGENT_HEADERS = {
 # Image filtering constants
 MIN_IMAGE_WIDTH = 200  # pixels
 MIN_IMAGE_HEIGHT = 200  # pixels
+# Smallest srcset variant worth downloading for OCR
+OCR_MIN_SOURCE_WIDTH = 800  # pixels
+# Wider images are decoded at 1/2, 1/4 or 1/8 scale, never below this width
+OCR_TARGET_WIDTH = 1280  # pixels
+# <picture> source types OpenCV can decode
+DECODABLE_IMAGE_TYPES = ['image/jpeg', 'image/png', 'image/webp', 'image/gif', 'image/bmp']
 
 
 # OCR constants
@@ -56,3 +84,18 @@ VALID_COUPON_CODE_PATTERN = r'^[A-Z0-9-_]{4,15}$'
 SCRAPE_TIMEOUT = 30  # seconds
 HEAD_REQUEST_TIMEOUT = 5  # seconds
 COUPON_SEARCH_TIMEOUT = 10  # seconds
+LLM_TIMEOUT = 60  # seconds
+
+# Download limits, bodies are streamed and aborted past these
+MAX_HTML_BYTES = 3 * 1024 * 1024
+MAX_IMAGE_BYTES = 8 * 1024 * 1024
+FETCH_CHUNK_SIZE = 64 * 1024
+
+# Response compression, small bodies are not worth the encoding overhead
+COMPRESS_MIN_BYTES = 512
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Profiling report sizes
+PROFILE_TOP_FUNCTIONS = 40
+PROFILE_MAX_STACK_DEPTH = 96
@@ -0,0 +1,129 @@
+import contextvars
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+class BudgetExhausted(Exception):
+    """Base class for stopping an agent run before it finishes."""
+
+
+class DeadlineExceeded(BudgetExhausted):
+    """The request deadline expired or the request was cancelled."""
+
+
+class EnoughCoupons(BudgetExhausted):
+    """Enough validated coupons were found to stop early."""
+
+
+class StepLimitReached(BudgetExhausted):
+    """The plan-and-execute loop ran the maximum number of steps."""
+
+
+class RequestBudget:
+    """Deadline, step cap and early-stop state shared by one request's tools."""
+
+    def __init__(self, seconds: float, max_coupons: Optional[int] = None,
+                 max_steps: Optional[int] = None):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self.max_coupons = max_coupons
+        self.max_steps = max_steps
+        self.steps = 0
+        self.coupons: List[Dict[str, str]] = []
+        self._seen = set()
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self._cancelled.is_set() or self.remaining() <= 0
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def timeout(self, default: float) -> float:
+        """Clamp a per-call timeout to what is left of the deadline."""
+        return max(0.001, min(default, self.remaining()))
+
+    def add_coupons(self, coupons: Iterable[Any]) -> None:
+        """Record validated coupons, as dicts or CouponCode models."""
+        with self._lock:
+            for coupon in coupons:
+                if not isinstance(coupon, dict):
+                    coupon = coupon.model_dump()
+                code = coupon.get("code")
+                if code and code not in self._seen:
+                    self._seen.add(code)
+                    self.coupons.append(
+                        {"code": code, "source": coupon.get("source", "")})
+
+    def enough_coupons(self) -> bool:
+        return self.max_coupons is not None and len(self.coupons) >= self.max_coupons
+
+    def check(self) -> None:
+        """Raise if the run should stop before its next LLM or tool call."""
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline of {self.seconds:.1f}s exceeded")
+        if self.enough_coupons():
+            raise EnoughCoupons(f"Found {len(self.coupons)} coupons")
+        if self.max_steps is not None and self.steps >= self.max_steps:
+            raise StepLimitReached(f"Reached {self.max_steps} plan steps")
+
+
+_current_budget: contextvars.ContextVar[Optional[RequestBudget]] = contextvars.ContextVar(
+    "discount_finder_budget", default=None)
+
+
+def start_budget(budget: RequestBudget) -> contextvars.Token:
+    return _current_budget.set(budget)
+
+
+def end_budget(token: contextvars.Token) -> None:
+    _current_budget.reset(token)
+
+
+def current_budget() -> Optional[RequestBudget]:
+    return _current_budget.get()
+
+
+def remaining_timeout(default: float) -> float:
+    """Per-call timeout bounded by the current request deadline, if any."""
+    budget = _current_budget.get()
+    return budget.timeout(default) if budget is not None else default
+
+
+def deadline_expired() -> bool:
+    budget = _current_budget.get()
+    return budget is not None and budget.expired()
+
+
+def record_coupons(coupons: Iterable[Any]) -> None:
+    budget = _current_budget.get()
+    if budget is not None:
+        budget.add_coupons(coupons)
+
+
+class BudgetCallbackHandler(BaseCallbackHandler):
+    """Stops the agent run at the next LLM or tool call once the budget is spent."""
+
+    raise_error = True
+
+    def __init__(self, budget: RequestBudget):
+        self.budget = budget
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs) -> None:
+        self.budget.check()
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages, **kwargs) -> None:
+        self.budget.check()
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs) -> None:
+        self.budget.check()
+
+    def on_agent_finish(self, finish, **kwargs) -> None:
+        self.budget.steps += 1
@@ -0,0 +1,77 @@
+import gzip
+import hashlib
+import os
+import re
+from typing import Iterable, Optional
+
+from discount_finder_langchain.config import config
+from discount_finder_langchain.http_cache import HttpCache
+
+# ASCII whitespace only, so the extension's regex normalizes identically
+WHITESPACE_RUN = re.compile(r"[ \t\n\r\f]+")
+
+
+def normalize_html(html: str) -> str:
+    """Collapse whitespace runs, the form the extension hashes and uploads."""
+    return WHITESPACE_RUN.sub(" ", html).strip(" ")
+
+
+def html_digest(normalized: str) -> str:
+    return hashlib.sha256(normalized.encode("utf-8", "replace")).hexdigest()
+
+
+def apply_delta(base: str, ops: Iterable) -> str:
+    """Rebuild a page from base with copy ("="), skip ("-") and insert ("+") ops.
+
+    Lengths count UTF-16 code units, as JavaScript string lengths do, so the
+    ops are applied to UTF-16 encoded text. Raises ValueError when the ops
+    do not cover the base page exactly.
+    """
+    source = base.encode("utf-16-le", "surrogatepass")
+    position = 0
+    parts = []
+    for op in ops:
+        if op.op == "+":
+            parts.append(op.text.encode("utf-16-le", "surrogatepass"))
+            continue
+        end = position + 2 * op.length
+        if end > len(source):
+            raise ValueError("Delta runs past the end of the base page")
+        if op.op == "=":
+            parts.append(source[position:end])
+        position = end
+    if position != len(source):
+        raise ValueError("Delta does not cover the whole base page")
+    return b"".join(parts).decode("utf-16-le", "surrogatepass")
+
+
+class HtmlStore(HttpCache):
+    """Normalized pages uploaded to /analyze_form, keyed by their sha256.
+
+    Pages are stored gzipped. Loading one refreshes its modification time so
+    pages still used as delta bases survive pruning.
+    """
+
+    def load(self, digest: str) -> Optional[str]:
+        _, body_path = self._paths(digest)
+        try:
+            html = gzip.decompress(body_path.read_bytes()).decode("utf-8", "surrogatepass")
+            os.utime(body_path)
+        except (OSError, ValueError, EOFError):
+            return None
+        return html
+
+    def store(self, digest: str, html: str) -> None:
+        _, body_path = self._paths(digest)
+        try:
+            if body_path.exists():
+                os.utime(body_path)
+                return
+            body_path.parent.mkdir(parents=True, exist_ok=True)
+            self._write(body_path, gzip.compress(html.encode("utf-8", "surrogatepass"), compresslevel=6))
+        except OSError:
+            return
+        self._count_put()
+
+
+html_store = HtmlStore(config.html_store_dir, config.html_store_max_bytes)
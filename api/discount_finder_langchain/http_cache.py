@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Mapping, Optional
+
+from discount_finder_langchain.config import config
+
+
+class CachedResponse:
+    """Body and validators of a cached HTTP response."""
+
+    def __init__(self, meta: Dict, body: bytes):
+        self.meta = meta
+        self.body = body
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Content-Type": self.meta.get("content_type", "")}
+
+    def is_fresh(self) -> bool:
+        max_age = self.meta.get("max_age")
+        if max_age is None or self.meta.get("no_cache"):
+            return False
+        return time.time() - self.meta.get("stored_at", 0) < max_age
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if etag := self.meta.get("etag"):
+            headers["If-None-Match"] = etag
+        if last_modified := self.meta.get("last_modified"):
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+
+class HttpCache:
+    """On-disk cache of GET responses keyed by URL.
+
+    Entries are written atomically, so several workers can share a directory.
+    Only responses with an ETag, Last-Modified or max-age are stored since
+    anything else could never be revalidated or reused.
+    """
+
+    PRUNE_EVERY = 200
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        folder = self.directory / key[:2]
+        return folder / f"{key}.json", folder / f"{key}.body"
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        meta_path, body_path = self._paths(url)
+        try:
+            meta = json.loads(meta_path.read_text())
+            body = body_path.read_bytes()
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url or len(body) != meta.get("size"):
+            return None
+        return CachedResponse(meta, body)
+
+    def put(self, url: str, headers: Mapping[str, str], body: bytes) -> None:
+        cache_control = headers.get("Cache-Control", "").lower()
+        if "no-store" in cache_control or "private" in cache_control:
+            return
+        max_age = re.search(r"max-age=(\d+)", cache_control)
+        meta = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "content_type": headers.get("Content-Type", ""),
+            "max_age": int(max_age.group(1)) if max_age else None,
+            "no_cache": "no-cache" in cache_control,
+            "stored_at": time.time(),
+            "size": len(body),
+        }
+        if not (meta["etag"] or meta["last_modified"] or meta["max_age"]):
+            return
+
+        meta_path, body_path = self._paths(url)
+        try:
+            meta_path.parent.mkdir(parents=True, exist_ok=True)
+            self._write(body_path, body)
+            self._write(meta_path, json.dumps(meta).encode())
+        except OSError:
+            return
+        self._count_put()
+
+    def _count_put(self) -> None:
+        with self._lock:
+            self._puts += 1
+            prune = self._puts % self.PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def touch(self, url: str) -> None:
+        """Mark a revalidated entry as fresh again."""
+        cached = self.get(url)
+        if cached is None:
+            return
+        cached.meta["stored_at"] = time.time()
+        meta_path, _ = self._paths(url)
+        try:
+            self._write(meta_path, json.dumps(cached.meta).encode())
+        except OSError:
+            pass
+
+    def prune(self) -> None:
+        """Drop least recently written entries until under max_bytes."""
+        entries = []
+        total = 0
+        for body_path in self.directory.glob("*/*.body"):
+            try:
+                stat = body_path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, body_path))
+            total += stat.st_size
+        for _, size, body_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for path in (body_path, body_path.with_suffix(".json")):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            total -= size
+
+    @staticmethod
+    def _write(path: Path, data: bytes) -> None:
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+
+http_cache = HttpCache(config.http_cache_dir, config.http_cache_max_bytes)
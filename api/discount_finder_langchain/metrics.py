@@ -0,0 +1,308 @@
+import contextvars
+import inspect
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_registry: List["_Metric"] = []
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Base class for metrics kept in the process-wide registry."""
+    type_name = ""
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}",
+                f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(
+                    f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+    type_name = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets."""
+    type_name = "histogram"
+
+    def __init__(self, *args, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # key -> (bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _format_labels(
+                        self.labelnames, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def render_metrics() -> str:
+    """Render every registered metric in the Prometheus text format.
+
+    Metrics are kept per process, so with several uvicorn workers each
+    scrape only sees the worker that served it.
+    """
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# METRICS
+
+REQUEST_SECONDS = Histogram(
+    "discount_finder_request_seconds", "End-to-end HTTP request latency", ("path", "status"))
+STAGE_SECONDS = Histogram(
+    "discount_finder_stage_seconds", "Wall time spent per pipeline stage", ("stage",))
+FETCH_BYTES = Counter(
+    "discount_finder_fetch_bytes_total", "Bytes fetched from remote sites", ("kind",))
+HTTP_CACHE_LOOKUPS = Counter(
+    "discount_finder_http_cache_total", "HTTP cache lookups by outcome", ("kind", "result"))
+RESULT_CACHE_LOOKUPS = Counter(
+    "discount_finder_result_cache_total", "Result cache lookups by outcome", ("endpoint", "result"))
+BODY_BYTES = Counter(
+    "discount_finder_body_bytes_total", "API request and response body bytes on the wire and decoded",
+    ("direction", "encoding", "layer"))
+FORM_UPLOADS = Counter(
+    "discount_finder_form_uploads_total", "/analyze_form requests by upload mode and outcome",
+    ("mode", "result"))
+IMAGES_DOWNLOADED = Counter(
+    "discount_finder_images_downloaded_total", "Images downloaded for OCR")
+IMAGES_OCRED = Counter(
+    "discount_finder_images_ocred_total", "Images passed through OCR")
+TEXT_FIRST_RESULTS = Counter(
+    "discount_finder_text_first_total", "Pages where codes were found in HTML before OCR", ("result",))
+OCR_SECONDS = Histogram(
+    "discount_finder_ocr_seconds", "Time spent inside the OCR model per image")
+LLM_CALLS = Counter(
+    "discount_finder_llm_calls_total", "LLM calls", ("model",))
+LLM_TOKENS = Counter(
+    "discount_finder_llm_tokens_total", "LLM tokens used", ("model", "kind"))
+TOOL_CALLS = Counter(
+    "discount_finder_tool_calls_total", "Agent tool invocations", ("tool",))
+PLANNER_STEPS = Histogram(
+    "discount_finder_planner_steps", "Plan-and-execute steps per run",
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15, 20))
+ADMISSION_ACTIVE = Gauge(
+    "discount_finder_admission_active", "Heavy pipelines currently running")
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "discount_finder_admission_queue_depth", "Requests waiting for a pipeline slot")
+ADMISSION_WAIT_SECONDS = Histogram(
+    "discount_finder_admission_wait_seconds", "Time spent waiting for a pipeline slot", ("endpoint",))
+ADMISSION_SHED = Counter(
+    "discount_finder_admission_shed_total", "Requests rejected with 429", ("endpoint", "reason"))
+PROCESS_RSS = Gauge(
+    "discount_finder_process_rss_bytes", "Resident memory of this worker process")
+
+
+# TRACING
+
+class RequestTrace:
+    """Per-request accumulator of stage timings and counters."""
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, float] = {}
+        # Thread CPU time per sync stage, only collected while profiling
+        self.cpu_stages: Optional[Dict[str, float]] = None
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_cpu(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.cpu_stages[name] = self.cpu_stages.get(name, 0.0) + seconds
+
+    def incr(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def server_timing(self) -> str:
+        """Format stage timings for the Server-Timing response header."""
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}"
+                         for name, seconds in self.stages.items())
+
+
+_current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar(
+    "discount_finder_trace", default=None)
+
+
+def start_trace(trace_id: Optional[str] = None) -> Tuple[RequestTrace, contextvars.Token]:
+    trace = RequestTrace(trace_id)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token: contextvars.Token) -> None:
+    _current_trace.reset(token)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def record(name: str, amount: float = 1) -> None:
+    """Add to a counter on the current request trace, if any."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.incr(name, amount)
+
+
+@contextmanager
+def stage(name: str, cpu: bool = True):
+    """Time a block as a pipeline stage.
+
+    When the request is being profiled, blocks that run on one thread
+    (cpu=True) also record that thread's CPU time.
+    """
+    trace = _current_trace.get()
+    cpu_start = None
+    if cpu and trace is not None and trace.cpu_stages is not None:
+        cpu_start = time.thread_time()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        if trace is not None:
+            trace.add_stage(name, elapsed)
+            if cpu_start is not None:
+                trace.add_cpu(name, time.thread_time() - cpu_start)
+
+
+def traced(name: str):
+    """Decorator form of `stage`."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            # Other tasks share the loop thread, so its CPU time says nothing here
+            with stage(name, cpu=False):
+                return await func(*args, **kwargs)
+
+        return async_wrapper if inspect.iscoroutinefunction(func) else wrapper
+    return decorator
+
+
+# CALLBACKS
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Counts LLM calls and token usage. Attach to chat model instances."""
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        llm_output = response.llm_output or {}
+        model = llm_output.get("model_name", "")
+        usage = llm_output.get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+
+        LLM_CALLS.inc(model=model)
+        LLM_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, model=model, kind="completion")
+        record("llm_calls")
+        record("prompt_tokens", prompt_tokens)
+        record("completion_tokens", completion_tokens)
+
+
+class AgentMetricsHandler(BaseCallbackHandler):
+    """Counts tool calls and executor steps. Pass in the agent run config."""
+
+    @property
+    def ignore_llm(self) -> bool:
+        return True
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs) -> None:
+        tool = (serialized or {}).get("name") or kwargs.get("name", "")
+        TOOL_CALLS.inc(tool=tool)
+        record("tool_calls")
+
+    def on_agent_finish(self, finish, **kwargs) -> None:
+        # Each plan step is run by the executor agent until it finishes
+        record("planner_steps")
@@ -0,0 +1,290 @@
+import logging
+import os
+import queue
+import threading
+import time
+from multiprocessing import AuthenticationError, resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+from discount_finder_langchain.config import config
+from discount_finder_langchain.constant import OCR_LANGUAGES
+from discount_finder_langchain.deadline import remaining_timeout
+from discount_finder_langchain.utils import rss_bytes, vprint
+
+# Image buffers and shared memory segments start at this size
+SHM_MIN_BYTES = 4 * 1024 * 1024
+SIDECAR_CONNECT_TIMEOUT = 60  # seconds
+# Longest wait for one image outside a request, inside one the deadline bounds it
+SIDECAR_READ_TIMEOUT = 120  # seconds
+
+
+def _detections_to_python(detections) -> List[Tuple[Any, str, float]]:
+    return [([[int(x), int(y)] for x, y in box], text, float(confidence))
+            for box, text, confidence in detections]
+
+
+class LocalOcr:
+    """EasyOCR model loaded in this process on first use."""
+
+    def __init__(self):
+        self._reader = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def reader(self):
+        if self._reader is None:
+            with self._lock:
+                if self._reader is None:
+                    import easyocr
+                    self._reader = easyocr.Reader(OCR_LANGUAGES)
+        return self._reader
+
+    def image_buffer(self, shape: Tuple[int, ...]) -> np.ndarray:
+        """Per-thread buffer reused across images, grown when too small."""
+        nbytes = int(np.prod(shape))
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or buffer.size < nbytes:
+            buffer = np.empty(max(SHM_MIN_BYTES, nbytes), dtype=np.uint8)
+            self._local.buffer = buffer
+        return buffer[:nbytes].reshape(shape)
+
+    def readtext(self, image: np.ndarray):
+        return self.reader.readtext(image)
+
+
+class SidecarOcr:
+    """Client for the OCR sidecar process.
+
+    Each thread owns a connection and a shared memory segment. Images built
+    in `image_buffer` are read by the sidecar in place, without copying.
+    """
+
+    def __init__(self, address: str, authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+        # Every thread's segment, so close() can unlink them at shutdown
+        self._segments = set()
+        self._segments_lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            deadline = time.monotonic() + SIDECAR_CONNECT_TIMEOUT
+            while True:
+                try:
+                    conn = Client(self.address, family="AF_UNIX",
+                                  authkey=self.authkey)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.2)
+            self._local.conn = conn
+        return conn
+
+    def _segment(self, nbytes: int) -> SharedMemory:
+        shm = getattr(self._local, "shm", None)
+        if shm is None or shm.size < nbytes:
+            if shm is not None:
+                self._release(shm)
+            size = max(SHM_MIN_BYTES, 1 << (nbytes - 1).bit_length())
+            shm = SharedMemory(create=True, size=size)
+            with self._segments_lock:
+                self._segments.add(shm)
+            self._local.shm = shm
+        return shm
+
+    def _release(self, shm: SharedMemory) -> None:
+        with self._segments_lock:
+            self._segments.discard(shm)
+        try:
+            shm.close()
+        except BufferError:
+            # An image view still points into it, the mapping goes with the view
+            pass
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _drop(self) -> None:
+        """Forget this thread's connection and segment, a late reply must not land in them."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+        shm = getattr(self._local, "shm", None)
+        if shm is not None:
+            self._release(shm)
+        self._local.shm = None
+
+    def close(self) -> None:
+        """Unlink every thread's segment, called at worker shutdown."""
+        with self._segments_lock:
+            segments = list(self._segments)
+        for shm in segments:
+            self._release(shm)
+
+    def image_buffer(self, shape: Tuple[int, ...]) -> np.ndarray:
+        nbytes = int(np.prod(shape))
+        shm = self._segment(nbytes)
+        return np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+
+    def _in_segment(self, image: np.ndarray) -> bool:
+        shm = getattr(self._local, "shm", None)
+        if shm is None or not image.flags.c_contiguous:
+            return False
+        base = np.ndarray((shm.size,), dtype=np.uint8, buffer=shm.buf)
+        return image.__array_interface__["data"][0] == base.__array_interface__["data"][0]
+
+    def readtext(self, image: np.ndarray):
+        if image.dtype != np.uint8 or not self._in_segment(image):
+            buffer = self.image_buffer(image.shape)
+            buffer[...] = image
+            image = buffer
+        conn = self._connection()
+        try:
+            conn.send(("readtext", self._local.shm.name,
+                      image.shape, image.dtype.str))
+            # The sidecar may be busy with other workers' images, don't wait past the deadline
+            timeout = remaining_timeout(SIDECAR_READ_TIMEOUT)
+            if not conn.poll(timeout):
+                self._drop()
+                raise TimeoutError(f"OCR sidecar did not answer within {timeout:.1f}s")
+            status, payload = conn.recv()
+        except (EOFError, OSError):
+            # Sidecar went away or timed out, reconnect on the next call
+            self._local.conn = None
+            raise
+        if status != "ok":
+            raise RuntimeError(f"OCR sidecar error: {payload}")
+        return payload
+
+
+_ocr = None
+_ocr_lock = threading.Lock()
+
+
+def get_ocr():
+    """OCR backend for this process, chosen by `config.ocr_mode`."""
+    global _ocr
+    if _ocr is None:
+        with _ocr_lock:
+            if _ocr is None:
+                if config.ocr_mode == "sidecar":
+                    _ocr = SidecarOcr(config.ocr_socket, config.ocr_authkey)
+                else:
+                    _ocr = LocalOcr()
+    return _ocr
+
+
+def close_ocr() -> None:
+    if isinstance(_ocr, SidecarOcr):
+        _ocr.close()
+
+
+def warm_up_ocr() -> None:
+    """Load the model (or connect to the sidecar) and log RSS before and after."""
+    before = rss_bytes()
+    ocr = get_ocr()
+    if isinstance(ocr, LocalOcr):
+        ocr.reader
+    else:
+        ocr._connection()
+    after = rss_bytes()
+    vprint(f"🧠 Worker {os.getpid()} OCR mode={config.ocr_mode} "
+           f"RSS before={before / 2**20:.0f} MiB after={after / 2**20:.0f} MiB")
+
+
+# SIDECAR SERVER
+
+def _attach(name: str) -> SharedMemory:
+    shm = SharedMemory(name=name)
+    # The client owns the segment, don't let our tracker unlink it on exit
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _serve_connection(conn, readers: queue.Queue) -> None:
+    shm: Optional[SharedMemory] = None
+    try:
+        while True:
+            try:
+                command, name, shape, dtype = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                if shm is None or shm.name != name:
+                    if shm is not None:
+                        shm.close()
+                    shm = _attach(name)
+                image = np.ndarray(shape, dtype=np.dtype(
+                    dtype), buffer=shm.buf)
+                # Each model runs one image at a time, further requests wait for a free one
+                reader = readers.get()
+                try:
+                    detections = reader.readtext(image)
+                finally:
+                    readers.put(reader)
+                del image
+                reply = ("ok", _detections_to_python(detections))
+            except Exception as e:
+                reply = ("error", str(e))
+            try:
+                conn.send(reply)
+            except OSError:
+                # The worker gave up on this image and closed the connection
+                return
+    finally:
+        if shm is not None:
+            shm.close()
+        conn.close()
+
+
+def serve_sidecar(address: Optional[str] = None, authkey: Optional[bytes] = None,
+                  readers: Optional[int] = None) -> None:
+    """Hold the EasyOCR models for all API workers on this node.
+
+    With one model (the default) OCR requests from all workers run one at a
+    time, `OCR_READERS` trades memory for concurrent OCR.
+    """
+    logging.basicConfig(level=config.log_level, format="%(message)s")
+    address = address or config.ocr_socket
+    authkey = authkey or config.ocr_authkey
+    readers = max(1, readers or config.ocr_readers)
+    if not authkey:
+        raise RuntimeError("OCR sidecar needs OCR_AUTHKEY set")
+    before = rss_bytes()
+    import easyocr
+    pool: queue.Queue = queue.Queue()
+    for _ in range(readers):
+        pool.put(easyocr.Reader(OCR_LANGUAGES))
+    vprint(f"🧠 OCR sidecar {os.getpid()} ready on {address} with {readers} model(s), "
+           f"RSS before={before / 2**20:.0f} MiB after={rss_bytes() / 2**20:.0f} MiB")
+
+    if os.path.exists(address):
+        os.unlink(address)
+    # Only this user may connect, the socket is created with mode 0600
+    umask = os.umask(0o177)
+    try:
+        listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    finally:
+        os.umask(umask)
+    with listener:
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, OSError) as e:
+                vprint(f"⚠️ Rejected OCR sidecar connection: {str(e)}")
+                continue
+            threading.Thread(target=_serve_connection,
+                             args=(conn, pool), daemon=True).start()
+
+if __name__ == "__main__":
+    serve_sidecar()
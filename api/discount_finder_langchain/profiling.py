@@ -0,0 +1,347 @@
+import contextvars
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from discount_finder_langchain.config import config
+from discount_finder_langchain.constant import PROFILE_MAX_STACK_DEPTH, PROFILE_TOP_FUNCTIONS
+from discount_finder_langchain.metrics import RequestTrace
+from discount_finder_langchain.utils import vprint
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+PROFILE_MODES = ("cprofile", "sample")
+# From 3.12 cProfile hooks sys.monitoring, which is process-wide: a request's
+# profile would also count every other thread, so those requests are sampled
+CPROFILE_PER_THREAD = sys.version_info < (3, 12)
+
+# Python frames a thread sits in while blocked on sockets, locks or the
+# OCR sidecar. Samples ending in one are tagged as waiting, not CPU.
+WAIT_FRAMES = {
+    ("selectors.py", "select"),
+    ("socket.py", "readinto"),
+    ("socket.py", "accept"),
+    ("socket.py", "create_connection"),
+    ("ssl.py", "read"),
+    ("ssl.py", "recv_into"),
+    ("ssl.py", "do_handshake"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("connection.py", "_recv"),
+    ("connection.py", "_poll"),
+    # httpcore, used by the OpenAI client, reads with socket.recv
+    ("sync.py", "read"),
+    # Idle thread pool workers block on their work queue
+    ("thread.py", "_worker"),
+}
+WAIT_TAG = "[wait]"
+
+
+def authorized(token: Optional[str]) -> bool:
+    return bool(config.profiling_token) and token is not None and hmac.compare_digest(
+        token.encode(), config.profiling_token.encode())
+
+
+def _frame_label(code) -> str:
+    path = Path(code.co_filename)
+    return f"{code.co_name} ({path.parent.name}/{path.name}:{code.co_firstlineno})"
+
+
+def fold_stack(frame) -> str:
+    """Collapse a frame chain into root-first flame-graph form."""
+    labels = []
+    leaf = frame
+    while frame is not None and len(labels) < PROFILE_MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    if (os.path.basename(leaf.f_code.co_filename), leaf.f_code.co_name) in WAIT_FRAMES:
+        labels.append(WAIT_TAG)
+    return ";".join(labels)
+
+
+def _render_folded(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class _ThreadSampler(threading.Thread):
+    """Samples one thread's stack every interval until stopped."""
+
+    def __init__(self, ident: int, interval: float, stacks: Counter):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.ident_to_sample = ident
+        self.interval = interval
+        self.stacks = stacks
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.ident_to_sample)
+            if frame is not None:
+                self.stacks[fold_stack(frame)] += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfile:
+    """A cProfile or stack-sampling capture of one request's pipeline.
+
+    The pipeline runs in a worker thread, so besides the profile itself we
+    record that thread's wall and CPU time. Wall time not spent on the CPU
+    went to LLM calls, downloads, OCR in the sidecar and other waits.
+    """
+
+    def __init__(self, mode: str, path: str, trace: RequestTrace):
+        self.profile_id = uuid.uuid4().hex
+        self.mode = mode if CPROFILE_PER_THREAD else "sample"
+        self.path = path
+        self.trace = trace
+        self.started_at = time.time()
+        self.pipeline_wall = 0.0
+        self.pipeline_cpu = 0.0
+        self.stacks: Counter = Counter()
+        self.profiler = cProfile.Profile() if self.mode == "cprofile" else None
+        trace.cpu_stages = {}
+
+    def run(self, func, *args, **kwargs):
+        sampler = None
+        if self.profiler is not None:
+            self.profiler.enable()
+        else:
+            sampler = _ThreadSampler(threading.get_ident(), config.profile_interval_seconds, self.stacks)
+            sampler.start()
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.pipeline_cpu += time.thread_time() - cpu_start
+            self.pipeline_wall += time.perf_counter() - wall_start
+            if self.profiler is not None:
+                self.profiler.disable()
+            else:
+                sampler.stop()
+
+    def _stats_text(self) -> str:
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=stream)
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        stats.sort_stats("tottime").print_stats(PROFILE_TOP_FUNCTIONS)
+        return stream.getvalue()
+
+    def report(self, wall_seconds: float) -> Dict:
+        cpu_stages = self.trace.cpu_stages or {}
+        stages = {}
+        for name, wall in self.trace.stages.items():
+            stages[name] = {"wall_seconds": round(wall, 6)}
+            if name in cpu_stages:
+                stages[name]["cpu_seconds"] = round(cpu_stages[name], 6)
+                stages[name]["wait_seconds"] = round(max(0.0, wall - cpu_stages[name]), 6)
+        report = {
+            "profile_id": self.profile_id,
+            "mode": self.mode,
+            "path": self.path,
+            "trace_id": self.trace.trace_id,
+            "started_at": self.started_at,
+            "wall_seconds": round(wall_seconds, 6),
+            "pipeline": {
+                "wall_seconds": round(self.pipeline_wall, 6),
+                "cpu_seconds": round(self.pipeline_cpu, 6),
+                "wait_seconds": round(max(0.0, self.pipeline_wall - self.pipeline_cpu), 6),
+            },
+            "stages": stages,
+        }
+        if self.profiler is not None:
+            # Requests answered from the result cache never ran the pipeline
+            report["stats"] = self._stats_text() if self.pipeline_wall else ""
+        else:
+            report["samples"] = sum(self.stacks.values())
+            report["folded"] = _render_folded(self.stacks)
+        return report
+
+
+_current_profile: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar(
+    "discount_finder_profile", default=None)
+
+
+def begin_profile(headers: Mapping[str, str], path: str,
+                  trace: RequestTrace) -> Optional[Tuple[RequestProfile, contextvars.Token]]:
+    """Start profiling this request if it asks for it with a valid admin token."""
+    mode = headers.get(PROFILE_HEADER, "").strip().lower()
+    if not mode:
+        return None
+    if mode not in PROFILE_MODES or not authorized(headers.get(ADMIN_TOKEN_HEADER)):
+        vprint("⚠️ Ignoring %s: %.16s on %s", PROFILE_HEADER, mode, path)
+        return None
+    profile = RequestProfile(mode, path, trace)
+    return profile, _current_profile.set(profile)
+
+
+def end_profile(token: contextvars.Token) -> None:
+    _current_profile.reset(token)
+
+
+def save_profile(profile: RequestProfile, wall_seconds: float) -> None:
+    profile_store.save(profile.report(wall_seconds))
+
+
+def run_profiled(func, *args, **kwargs):
+    """Call func, under the request's profiler when one was asked for.
+
+    Meant for the worker thread running the pipeline, the profile reaches it
+    through the context `asyncio.to_thread` copies.
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        return func(*args, **kwargs)
+    return profile.run(func, *args, **kwargs)
+
+
+class ProfileStore:
+    """Reports of profiled requests on disk, shared by all workers.
+
+    Only the newest `keep` reports are kept.
+    """
+
+    def __init__(self, directory: str, keep: int):
+        self.directory = Path(directory) / "requests"
+        self.keep = keep
+
+    def save(self, report: Dict) -> None:
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f"{report['profile_id']}.json"
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(report))
+            os.replace(tmp, path)
+        except OSError as e:
+            vprint("⚠️ Could not save profile: %s", e)
+            return
+        for old in self._paths()[self.keep:]:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+
+    def _paths(self) -> List[Path]:
+        paths = []
+        for path in self.directory.glob("*.json"):
+            try:
+                paths.append((path.stat().st_mtime, path))
+            except OSError:
+                continue
+        return [path for _, path in sorted(paths, reverse=True)]
+
+    def get(self, profile_id: str) -> Optional[Dict]:
+        if not profile_id.isalnum():
+            return None
+        try:
+            return json.loads((self.directory / f"{profile_id}.json").read_text())
+        except (OSError, ValueError):
+            return None
+
+    def list(self) -> List[Dict]:
+        summaries = []
+        for path in self._paths():
+            try:
+                report = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            summaries.append({key: report[key] for key in
+                              ("profile_id", "mode", "path", "trace_id", "started_at", "wall_seconds")})
+        return summaries
+
+
+profile_store = ProfileStore(config.profile_dir, config.profile_keep)
+
+
+# ROLLING SAMPLER
+
+class RollingSampler:
+    """Samples every thread at a low rate into per-minute folded stacks.
+
+    Each worker writes a finished minute to the profile directory, so a
+    flame graph can be built from all workers over the last few minutes.
+    """
+
+    def __init__(self, directory: str, hz: float, window_minutes: int):
+        self.directory = Path(directory) / "rolling"
+        self.interval = 1.0 / hz
+        self.window_minutes = window_minutes
+        self.minute = int(time.time() // 60)
+        self.stacks: Counter = Counter()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="rolling-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            minute = int(time.time() // 60)
+            with self._lock:
+                if minute != self.minute:
+                    self._flush()
+                    self.minute = minute
+                for ident, frame in frames.items():
+                    if ident != own:
+                        self.stacks[fold_stack(frame)] += 1
+            del frames
+
+    def _flush(self) -> None:
+        stacks, self.stacks = self.stacks, Counter()
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f"{self.minute}-{os.getpid()}.folded"
+            path.write_text(_render_folded(stacks))
+            oldest = self.minute - self.window_minutes
+            for old in self.directory.glob("*.folded"):
+                if int(old.name.split("-")[0]) < oldest:
+                    old.unlink()
+        except (OSError, ValueError):
+            pass
+
+    def folded(self, minutes: int) -> str:
+        """Folded stacks of all workers over the last minutes, plus this worker's current minute."""
+        with self._lock:
+            stacks = Counter(self.stacks)
+            current = self.minute
+        for path in self.directory.glob("*.folded"):
+            try:
+                if int(path.name.split("-")[0]) < current - minutes:
+                    continue
+                for line in path.read_text().splitlines():
+                    stack, _, count = line.rpartition(" ")
+                    stacks[stack] += int(count)
+            except (OSError, ValueError):
+                continue
+        return _render_folded(stacks)
+
+
+rolling_sampler: Optional[RollingSampler] = None
+
+
+def start_rolling_sampler() -> None:
+    global rolling_sampler
+    if not config.profiling_enabled or config.profile_sample_hz <= 0 or rolling_sampler is not None:
+        return
+    rolling_sampler = RollingSampler(
+        config.profile_dir, config.profile_sample_hz, config.profile_window_minutes)
+    rolling_sampler.start()
+    vprint("🔥 Worker %s sampling stacks at %g Hz", os.getpid(), config.profile_sample_hz)
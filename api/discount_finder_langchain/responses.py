@@ -0,0 +1,98 @@
+import hashlib
+import time
+from typing import Optional
+
+from fastapi import Response
+from pydantic import BaseModel
+
+from discount_finder_langchain.compression import RESPONSE_ENCODINGS
+from discount_finder_langchain.config import config
+from discount_finder_langchain.http_cache import HttpCache
+from discount_finder_langchain.metrics import RESULT_CACHE_LOOKUPS
+
+JSON_MEDIA_TYPE = "application/json"
+
+# Shared by all workers, entries are keyed by endpoint and request
+result_cache = HttpCache(config.result_cache_dir, config.result_cache_max_bytes)
+
+
+def cache_key(endpoint: str, *parts: str) -> str:
+    return f"{endpoint}:" + hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def strong_etag(body: bytes) -> str:
+    return '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires, ignoring encoding suffixes."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        for encoding in RESPONSE_ENCODINGS:
+            if candidate.endswith(f'-{encoding}"'):
+                candidate = candidate[:-len(encoding) - 2] + '"'
+        if candidate == etag:
+            return True
+    return False
+
+
+def _etagged_response(body: bytes, etag: str, max_age: int, if_none_match: Optional[str]) -> Response:
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={max_age}"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=JSON_MEDIA_TYPE, headers=headers)
+
+
+def cached_result(endpoint: str, key: str, if_none_match: Optional[str],
+                  count_miss: bool = True) -> Optional[Response]:
+    """Answer from the result cache, with a 304 when the client already has it.
+
+    Reads the disk, call it off the event loop.
+    """
+    if not config.result_cache_enabled:
+        return None
+    cached = result_cache.get(key)
+    if cached is None or not cached.is_fresh():
+        if count_miss:
+            RESULT_CACHE_LOOKUPS.inc(endpoint=endpoint, result="miss")
+        return None
+    etag = cached.meta["etag"]
+    response = _etagged_response(
+        cached.body, etag,
+        max(0, int(cached.meta["max_age"] - (time.time() - cached.meta["stored_at"]))),
+        if_none_match)
+    RESULT_CACHE_LOOKUPS.inc(
+        endpoint=endpoint, result="not_modified" if response.status_code == 304 else "hit")
+    return response
+
+
+def uncached_response(model: BaseModel) -> Response:
+    return Response(content=model.model_dump_json(), media_type=JSON_MEDIA_TYPE,
+                    headers={"Cache-Control": "no-store"})
+
+
+def result_response(endpoint: str, key: str, model: BaseModel, if_none_match: Optional[str],
+                    cacheable: bool) -> Response:
+    """Serialize once with pydantic-core and attach a strong ETag.
+
+    Complete results are stored so later requests and revalidations skip the
+    pipeline, partial or failed ones are sent with no-store. Writes the disk
+    and may prune the cache, call it off the event loop.
+    """
+    if not cacheable:
+        return uncached_response(model)
+    body = model.model_dump_json().encode()
+    etag = strong_etag(body)
+    if config.result_cache_enabled:
+        result_cache.put(key, {
+            "ETag": etag,
+            "Cache-Control": f"max-age={config.result_cache_seconds}",
+            "Content-Type": JSON_MEDIA_TYPE,
+        }, body)
+    return _etagged_response(body, etag, config.result_cache_seconds, if_none_match)
@@ -1,22 +1,141 @@
-from fastapi import APIRouter
+import asyncio
+from typing import Awaitable, Callable, Optional, Tuple
+
+from fastapi import APIRouter, Header, HTTPException, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel
 from discount_finder_langchain.schemas import (
     UrlAnalyzeRequest,
     HtmlAnalyzeRequest,
     AnalyzeResponse,
     FormAnalyzeResponse
 )
-from discount_finder_langchain.services import analyze_service, analyze_form_service
+from discount_finder_langchain.services import (
+    analyze_service,
+    analyze_form_service,
+    create_budget,
+    resolve_form_html,
+)
+from discount_finder_langchain.deadline import RequestBudget
+from discount_finder_langchain.html_store import html_store
+from discount_finder_langchain import profiling
+from discount_finder_langchain.config import config
+from discount_finder_langchain.responses import cache_key, cached_result, result_response, uncached_response
+from discount_finder_langchain.metrics import FORM_UPLOADS, PROCESS_RSS, render_metrics
+from discount_finder_langchain.utils import rss_bytes
+from discount_finder_langchain.admission import (
+    PRIORITY_ANALYZE,
+    PRIORITY_FORM,
+    Overloaded,
+    admission,
+)
 router = APIRouter()
 
 
-@router.post("/analyze", response_model=AnalyzeResponse)
-async def analyze_endpoint(request: UrlAnalyzeRequest) -> AnalyzeResponse:
+def _too_many_requests(error: Overloaded) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(error),
+                         headers={"Retry-After": str(error.retry_after)})
+
+
+async def _run_admitted(endpoint: str, priority: int, key: str, if_none_match: Optional[str],
+                        budget: RequestBudget,
+                        run: Callable[[], Awaitable[Tuple[BaseModel, Optional[str]]]]) -> Response:
+    """Run the pipeline under admission control and cache a complete result.
 
-    response, _ = await analyze_service(request)
-    return response
+    Callers look up the result cache first, so hits never queue here. The
+    queue wait is capped by what is left of the request's budget.
+    """
+    try:
+        async with admission.slot(priority, endpoint, max_wait=budget.remaining()):
+            # An identical request may have finished while this one was queued
+            cached = await asyncio.to_thread(cached_result, endpoint, key, if_none_match,
+                                             count_miss=False)
+            if cached is not None:
+                return cached
+            response, error = await run()
+    except Overloaded as e:
+        raise _too_many_requests(e)
+    # Cache reads and writes touch the disk, and every so often prune it
+    return await asyncio.to_thread(result_response, endpoint, key, response, if_none_match,
+                                   cacheable=error is None and not response.incomplete)
+
+
+@router.post("/analyze", response_model=AnalyzeResponse)
+async def analyze_endpoint(request: UrlAnalyzeRequest,
+                           if_none_match: Optional[str] = Header(default=None)) -> Response:
+    max_coupons = request.max_coupons or config.early_stop_coupons
+    budget = create_budget(request.deadline_seconds, max_coupons)
+    key = cache_key("analyze", request.clean_url, str(max_coupons))
+    cached = await asyncio.to_thread(cached_result, "analyze", key, if_none_match)
+    if cached is not None:
+        return cached
+    return await _run_admitted("analyze", PRIORITY_ANALYZE, key, if_none_match, budget,
+                               lambda: analyze_service(request, budget))
 
 
 @router.post("/analyze_form", response_model=FormAnalyzeResponse)
-async def analyze_form_endpoint(request: HtmlAnalyzeRequest) -> FormAnalyzeResponse:
-    response, _ = await analyze_form_service(request)
-    return response
+async def analyze_form_endpoint(request: HtmlAnalyzeRequest,
+                                if_none_match: Optional[str] = Header(default=None)) -> Response:
+    """Clients may send only html_hash first and upload the page, or a delta
+    against an earlier upload, when the response has html_required set."""
+    budget = create_budget(request.deadline_seconds)
+    mode = ("full" if request.html_page is not None
+            else "delta" if request.html_delta is not None else "hash")
+    html, digest = await asyncio.to_thread(resolve_form_html, request)
+    if digest is None:
+        FORM_UPLOADS.inc(mode=mode, result="html_required")
+        return uncached_response(FormAnalyzeResponse(html_required=True))
+
+    key = cache_key("analyze_form", digest)
+    cached = await asyncio.to_thread(cached_result, "analyze_form", key, if_none_match)
+    if cached is not None:
+        FORM_UPLOADS.inc(mode=mode, result="cached")
+        return cached
+    if html is None:
+        # Known page without a stored result, analyze it without an upload
+        html = await asyncio.to_thread(html_store.load, digest)
+        if html is None:
+            FORM_UPLOADS.inc(mode=mode, result="html_required")
+            return uncached_response(FormAnalyzeResponse(html_required=True))
+
+    FORM_UPLOADS.inc(mode=mode, result="analyzed")
+    return await _run_admitted("analyze_form", PRIORITY_FORM, key, if_none_match, budget,
+                               lambda: analyze_form_service(request, html, budget))
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint() -> PlainTextResponse:
+    PROCESS_RSS.set(rss_bytes())
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def _check_admin(token: Optional[str]) -> None:
+    if not config.profiling_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiling.authorized(token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@router.get("/admin/profiles")
+async def list_profiles_endpoint(x_admin_token: Optional[str] = Header(default=None)) -> JSONResponse:
+    _check_admin(x_admin_token)
+    return JSONResponse(await asyncio.to_thread(profiling.profile_store.list))
+
+
+@router.get("/admin/profiles/{profile_id}")
+async def profile_endpoint(profile_id: str, x_admin_token: Optional[str] = Header(default=None)) -> JSONResponse:
+    _check_admin(x_admin_token)
+    report = await asyncio.to_thread(profiling.profile_store.get, profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return JSONResponse(report)
+
+
+@router.get("/admin/profile/flamegraph", response_class=PlainTextResponse)
+async def flamegraph_endpoint(minutes: int = 5,
+                              x_admin_token: Optional[str] = Header(default=None)) -> PlainTextResponse:
+    """Folded stacks from the rolling sampler, for flamegraph.pl or speedscope."""
+    _check_admin(x_admin_token)
+    if profiling.rolling_sampler is None:
+        raise HTTPException(status_code=404, detail="Rolling sampler is not running")
+    return PlainTextResponse(await asyncio.to_thread(profiling.rolling_sampler.folded, minutes))
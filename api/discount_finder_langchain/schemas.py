@@ -1,11 +1,15 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Literal, Optional
 from urllib.parse import urlparse, unquote
 
 
 class UrlAnalyzeRequest(BaseModel):
     url: str = Field(
         description="The URL to analyze for coupon codes and discounts")
+    deadline_seconds: Optional[float] = Field(
+        default=None, gt=0, description="Seconds the client is willing to wait, capped by the server deadline")
+    max_coupons: Optional[int] = Field(
+        default=None, gt=0, description="Stop searching once this many validated coupons are found")
 
     @property
     def clean_url(self) -> str:
@@ -17,9 +21,38 @@ class UrlAnalyzeRequest(BaseModel):
         return cleaned
 
 
+SHA256_HEX_PATTERN = r"^[0-9a-f]{64}$"
+
+
+class HtmlDeltaOp(BaseModel):
+    """One step of an HTML delta, lengths count UTF-16 code units"""
+    op: Literal["=", "-", "+"] = Field(
+        description="= copies length characters of the base page, - skips them, + inserts text")
+    length: int = Field(default=0, ge=0, description="Characters to copy or skip")
+    text: str = Field(default="", description="Text to insert")
+
+
 class HtmlAnalyzeRequest(BaseModel):
-    html_page: str = Field(
-        description="Raw HTML content to analyze for coupon form fields")
+    html_page: Optional[str] = Field(
+        default=None, description="Raw HTML content to analyze for coupon form fields")
+    html_hash: Optional[str] = Field(
+        default=None, pattern=SHA256_HEX_PATTERN,
+        description="sha256 of the whitespace-normalized page, sent alone first so the server can answer without the upload")
+    base_hash: Optional[str] = Field(
+        default=None, pattern=SHA256_HEX_PATTERN,
+        description="html_hash of a page uploaded earlier that html_delta applies to")
+    html_delta: Optional[List[HtmlDeltaOp]] = Field(
+        default=None, description="Edits turning the base page into the normalized page")
+    deadline_seconds: Optional[float] = Field(
+        default=None, gt=0, description="Seconds the client is willing to wait, capped by the server deadline")
+
+    @model_validator(mode="after")
+    def check_upload(self):
+        if self.html_page is None and self.html_hash is None:
+            raise ValueError("html_page or html_hash is required")
+        if self.html_delta is not None and (self.base_hash is None or self.html_hash is None):
+            raise ValueError("html_delta needs base_hash and html_hash")
+        return self
 
 
 class CouponCode(BaseModel):
@@ -58,12 +91,18 @@ class FormAnalyzeResponse(BaseModel):
     """Response model for form analysis endpoint"""
     form_fields: Optional[FormFields] = Field(
         default=None, description="Details of found coupon form fields")
+    incomplete: bool = Field(
+        default=False, description="True when the deadline ended the analysis early")
+    html_required: bool = Field(
+        default=False, description="True when the server does not know html_hash, resend with html_page or html_delta")
 
 
 class AnalyzeResponse(BaseModel):
     """Response model for URL analysis endpoint"""
     coupons: Optional[List[CouponCode]] = Field(
         default=[], description="List of found coupon codes and their details")
+    incomplete: bool = Field(
+        default=False, description="True when the deadline ended the search early and coupons are partial")
 
 
 class ExtractCouponsFromTextInputTool(BaseModel):
@@ -9,27 +9,89 @@ from discount_finder_langchain.schemas import (
 )
 
 from discount_finder_langchain.agent import create_new_discount_finder_agent
-from typing import Tuple
+from discount_finder_langchain.config import config
+from discount_finder_langchain.deadline import (
+    BudgetCallbackHandler,
+    BudgetExhausted,
+    DeadlineExceeded,
+    EnoughCoupons,
+    RequestBudget,
+    end_budget,
+    start_budget,
+)
+from typing import Optional, Tuple
 from discount_finder_langchain.utils import parse_agent_response, vprint
+from discount_finder_langchain.profiling import run_profiled
+from discount_finder_langchain.html_store import apply_delta, html_digest, html_store, normalize_html
+from discount_finder_langchain.metrics import (
+    PLANNER_STEPS,
+    AgentMetricsHandler,
+    current_trace,
+    traced,
+)
+import asyncio
 import json
+import logging
 import traceback
 
 
-async def analyze_service(request: UrlAnalyzeRequest) -> Tuple[AnalyzeResponse, str | None]:
-    """Returns (response, error)"""
+def create_budget(deadline_seconds: Optional[float], max_coupons: Optional[int] = None) -> RequestBudget:
+    """Build the request budget, clients can only shorten the configured deadline.
+
+    Created when the request arrives, time spent queued for admission
+    counts against the deadline.
+    """
+    seconds = config.request_deadline_seconds
+    if deadline_seconds:
+        seconds = min(seconds, deadline_seconds)
+    return RequestBudget(seconds, max_coupons=max_coupons, max_steps=config.max_plan_steps)
+
+
+async def _run_agent(inputs, budget: RequestBudget):
+    """Run a new agent in a worker thread under the request budget.
+
+    Raises a BudgetExhausted subclass when the deadline, step cap or
+    early-stop coupon count ends the run before the agent finishes.
+    """
+    token = start_budget(budget)
     try:
+        # Created after the budget is set so LLM and executor timeouts are clamped
         agent = create_new_discount_finder_agent()
-        vprint(f"🔍 Analyzing URL: {request.clean_url}")
-        resp = agent.invoke(
+        callbacks = [AgentMetricsHandler(), BudgetCallbackHandler(budget)]
+        try:
+            return await asyncio.wait_for(
+                asyncio.to_thread(run_profiled, agent.invoke, inputs,
+                                  config={"callbacks": callbacks}),
+                timeout=budget.remaining())
+        except asyncio.TimeoutError:
+            # The worker thread stops at its next tool or LLM call
+            budget.cancel()
+            raise DeadlineExceeded(
+                f"Deadline of {budget.seconds:.1f}s exceeded")
+    finally:
+        end_budget(token)
+        trace = current_trace()
+        if trace is not None:
+            PLANNER_STEPS.observe(trace.counters.get("planner_steps", 0))
+
+
+@traced("analyze_service")
+async def analyze_service(request: UrlAnalyzeRequest,
+                          budget: RequestBudget) -> Tuple[AnalyzeResponse, str | None]:
+    """Returns (response, error)"""
+    try:
+        vprint("🔍 Analyzing URL: %s", request.clean_url)
+        resp = await _run_agent(
             [
                 {"objective": "find coupons from provided website's homepage or try to find them from well-known coupon websites"},
                 {"input": f"url: {request.clean_url}"},
                 {"output_format":
                     "Return ONLY a JSON string in this exact format: { \"coupons\": [{ \"code\": \"EXAMPLE\", \"source\": \"Source\" }] }"}
-            ]
+            ],
+            budget
         )
 
-        vprint(f"🤖 Raw agent response: {resp}")
+        vprint("🤖 Raw agent response: %s", resp, level=logging.DEBUG)
 
         # Try to extract the JSON string from the response
         output = resp
@@ -48,13 +110,21 @@ async def analyze_service(request: UrlAnalyzeRequest) -> Tuple[AnalyzeResponse,
         try:
             data = json.loads(output)
             coupons = data.get("coupons", [])
-            vprint(f"🤖 Parsed coupons: {coupons}")
+            vprint("🤖 Parsed coupons: %s", coupons)
             return AnalyzeResponse(coupons=coupons), None
         except json.JSONDecodeError as e:
             error_msg = f"Failed to parse JSON response: {str(e)}"
             vprint(error_msg)
             return AnalyzeResponse(coupons=[]), error_msg
 
+    except EnoughCoupons:
+        vprint("✅ Stopping early with %s coupons", len(budget.coupons))
+        return AnalyzeResponse(coupons=budget.coupons), None
+
+    except BudgetExhausted as e:
+        vprint("⏱️ %s, returning %s coupons found so far", e, len(budget.coupons))
+        return AnalyzeResponse(coupons=budget.coupons, incomplete=True), str(e)
+
     except Exception as e:
 
         error_msg = f"Error analyzing URL: {str(e)}\n{traceback.format_exc()}"
@@ -62,17 +132,48 @@ async def analyze_service(request: UrlAnalyzeRequest) -> Tuple[AnalyzeResponse,
         return AnalyzeResponse(coupons=[]), error_msg
 
 
-async def analyze_form_service(request: HtmlAnalyzeRequest) -> Tuple[FormAnalyzeResponse, str | None]:
+def resolve_form_html(request: HtmlAnalyzeRequest) -> Tuple[Optional[str], Optional[str]]:
+    """Returns (normalized html, digest) for an /analyze_form request.
+
+    A full page or a delta is stored by digest for later hash-only requests.
+    Hash-only requests give no html, and a delta whose base is unknown or
+    whose result does not match html_hash gives neither.
+    """
+    if request.html_page is not None:
+        html = normalize_html(request.html_page)
+    elif request.html_delta is not None:
+        base = html_store.load(request.base_hash)
+        if base is None:
+            return None, None
+        try:
+            html = apply_delta(base, request.html_delta)
+        except ValueError as e:
+            vprint("⚠️ Rejected HTML delta: %s", e)
+            return None, None
+        if html_digest(html) != request.html_hash:
+            vprint("⚠️ HTML delta does not match html_hash")
+            return None, None
+    else:
+        return None, request.html_hash
+
+    digest = html_digest(html)
+    html_store.store(digest, html)
+    return html, digest
+
+
+@traced("analyze_form_service")
+async def analyze_form_service(request: HtmlAnalyzeRequest, html: str,
+                               budget: RequestBudget) -> Tuple[FormAnalyzeResponse, str | None]:
     """Returns(response, error)"""
     try:
-        agent = create_new_discount_finder_agent()
-        resp = agent.invoke(
+        resp = await _run_agent(
             [
                 {"objective": f"finding coupon form field and button from provided html page after cleaning style script svg iframe like html tags and other non-relevant elements"},
-                {"input": f"html: {request.html_page}"},
+                {"input": f"html: {html}"},
                 {"output_format":
                     "Return ONLY a JSON string in this exact format: { \"form_fields\": { \"coupon_input\": { \"css_path\": \"EXAMPLE\" }, \"apply_button\": { \"css_path\": \"EXAMPLE\" } } }"}
-            ]
+            ],
+            budget
         )
 
         data, error = parse_agent_response(resp)
@@ -88,5 +189,9 @@ async def analyze_form_service(request: HtmlAnalyzeRequest) -> Tuple[FormAnalyze
 
         return FormAnalyzeResponse(form_fields=form_fields), None
 
+    except BudgetExhausted as e:
+        vprint("⏱️ %s, form analysis incomplete", e)
+        return FormAnalyzeResponse(form_fields=None, incomplete=True), str(e)
+
     except Exception as e:
         return FormAnalyzeResponse(form_fields=None), str(e)
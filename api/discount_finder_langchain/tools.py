@@ -1,7 +1,4 @@
 import json
-import requests
-import re
-import easyocr
 from bs4 import BeautifulSoup
 from langchain_core.output_parsers.json import SimpleJsonOutputParser
 from discount_finder_langchain.prompts import (
@@ -20,34 +17,53 @@ from discount_finder_langchain.schemas import (
     CleanHtmlInputTool
 )
 from discount_finder_langchain.constant import (
-    CODE_PATTERNS,
     COUPON_SELECTORS,
     COUPON_ATTRIBUTES,
     COUPON_SITES,
     SCRAPE_TIMEOUT,
-    COUPON_SEARCH_TIMEOUT
+    COUPON_SEARCH_TIMEOUT,
+    LLM_TIMEOUT
 )
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Union
 from discount_finder_langchain.schemas import CouponCode, CouponCodeList
 from discount_finder_langchain.utils import (
     fetch_url_content,
+    fetch_image,
+    find_coupons_in_html,
     process_image_for_ocr,
     filter_image_by_size,
     extract_base_url,
     process_ocr_detection,
     validate_coupon_code,
+    CODE_MATCHERS,
 )
 from discount_finder_langchain.utils import vprint
+from discount_finder_langchain.metrics import (
+    IMAGES_DOWNLOADED,
+    IMAGES_OCRED,
+    OCR_SECONDS,
+    TEXT_FIRST_RESULTS,
+    LLMMetricsHandler,
+    record,
+    traced,
+)
+from discount_finder_langchain.deadline import (
+    deadline_expired,
+    record_coupons,
+    remaining_timeout,
+)
+from discount_finder_langchain.ocr import get_ocr
 from langchain_openai import ChatOpenAI
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-reader = easyocr.Reader(['en'])
 
 
-def scrape_some_images_from_website_tool_func(url: str) -> Optional[List[str]]:
+@traced("scrape_some_images_from_website")
+def scrape_some_images_from_website_tool_func(url: str) -> Optional[Union[List[str], Dict[str, Any]]]:
     vprint("🌐 Scraping website...")
     images = []
     try:
@@ -59,16 +75,27 @@ def scrape_some_images_from_website_tool_func(url: str) -> Optional[List[str]]:
         vprint("🧹 Cleaning HTML content...")
         soup = BeautifulSoup(html_content, "html.parser")
 
+        # Codes in coupon attributes or embedded state make image download and
+        # OCR unnecessary, ones read from free text are returned with the images
+        text_coupons, conclusive = find_coupons_in_html(html_content, soup, url)
+        if conclusive:
+            TEXT_FIRST_RESULTS.inc(result="hit")
+            record("text_first_hits")
+            record_coupons(text_coupons)
+            vprint("✅ Found %s codes in page HTML, skipping image OCR", len(text_coupons))
+            return {"coupons": text_coupons, "images": []}
+        TEXT_FIRST_RESULTS.inc(result="text_only" if text_coupons else "miss")
+
         # Find all image tags
 
         img_tags = soup.find_all('img', limit=250)
-        vprint(f"Found {len(img_tags)} total image tags")
+        vprint("Found %s total image tags", len(img_tags))
 
         # Extract base URL
         base_url = extract_base_url(url)
         if not base_url:
             vprint("⚠️ Could not determine base URL, using original URL")
-            return []
+            return {"coupons": text_coupons, "images": []} if text_coupons else []
 
         for img in img_tags:
             try:
@@ -76,66 +103,85 @@ def scrape_some_images_from_website_tool_func(url: str) -> Optional[List[str]]:
                 if src and src not in images:
                     images.append(src)
             except Exception as img_error:
-                vprint(
-                    f"⚠️ Error processing individual image: {str(img_error)}")
+                vprint("⚠️ Error processing individual image: %s", img_error)
                 continue
 
         vprint("✅ Website scraping completed successfully")
+        if text_coupons:
+            return {"coupons": text_coupons, "images": images}
         return images
 
     except Exception as e:
-        vprint(f"❌ Error scraping website: {str(e)}")
+        vprint("❌ Error scraping website: %s", e)
         return images
 
 
+@traced("extract_text_from_images")
 def extract_text_from_images_tool_func(images: List[str]) -> Optional[List[object]]:
     vprint("🔍 Starting image analysis...")
     try:
         all_extracted_texts = []
-        vprint(f"📸 Processing {len(images)} images...")
+        vprint("📸 Processing %s images...", len(images))
         for idx, img_url in enumerate(images, 1):
+            if deadline_expired():
+                vprint("⏱️ Deadline reached, skipping %s remaining images",
+                       len(images) - idx + 1)
+                break
             try:
-                vprint(
-                    f"🖼️ Analyzing image {idx}/{len(images)}: {img_url[:50]}...")
-                resp = requests.get(img_url, timeout=SCRAPE_TIMEOUT)
-                resp.raise_for_status()
+                vprint("🖼️ Analyzing image %s/%s: %.50s...", idx, len(images), img_url)
+                image_content = fetch_image(img_url, SCRAPE_TIMEOUT)
+                if image_content is None:
+                    continue
+                IMAGES_DOWNLOADED.inc()
+                record("images_downloaded")
 
-                enhanced = process_image_for_ocr(resp.content)
+                ocr = get_ocr()
+                enhanced = process_image_for_ocr(
+                    image_content, allocate=ocr.image_buffer)
                 if enhanced is None:
                     continue
 
                 vprint("📝 Performing OCR...")
-                detections = reader.readtext(enhanced)
+                ocr_start = time.perf_counter()
+                detections = ocr.readtext(enhanced)
+                ocr_seconds = time.perf_counter() - ocr_start
+                IMAGES_OCRED.inc()
+                OCR_SECONDS.observe(ocr_seconds)
+                record("images_ocred")
+                record("ocr_seconds", ocr_seconds)
                 for detection in detections:
                     result = process_ocr_detection(detection)
                     if result:
                         all_extracted_texts.append(result)
 
                 if all_extracted_texts:
-                    vprint(f"✅ Found {len(all_extracted_texts)} text segments")
+                    vprint("✅ Found %s text segments", len(all_extracted_texts))
                 else:
                     vprint("⚠️ No text found in image")
             except Exception as e:
-                vprint(f"❌ Error processing image {img_url}: {e}")
+                vprint("❌ Error processing image %s: %s", img_url, e)
                 continue
 
-        vprint(
-            f"✨ Image analysis completed. Found {len(all_extracted_texts)} text segments in total")
+        vprint("✨ Image analysis completed. Found %s text segments in total",
+               len(all_extracted_texts))
         return all_extracted_texts
     except Exception as e:
-        vprint(f"❌ Error in image analysis: {str(e)}")
+        vprint("❌ Error in image analysis: %s", e)
         return []
 
 
+@traced("extract_coupons_from_text")
 def extract_coupons_from_text_tool_func(extracted_texts: List[object]) -> Optional[List[CouponCode]]:
     vprint("🔍 Starting coupon extraction from text...")
-    vprint(f"📝 Analyzing text of length: {len(extracted_texts)}")
+    vprint("📝 Analyzing text of length: %s", len(extracted_texts))
     try:
         llm = ChatOpenAI(
             temperature=0,
             openai_api_key=OPENAI_API_KEY,
             model="gpt-4o-mini",
-            model_kwargs={"response_format": {"type": "json_object"}}
+            model_kwargs={"response_format": {"type": "json_object"}},
+            callbacks=[LLMMetricsHandler()],
+            timeout=remaining_timeout(LLM_TIMEOUT)
         )
         chain = EXTRACT_COUPONS_FROM_TEXT_PROMPT | llm | PARSER_COUPON_CODE_LIST
         result = chain.invoke({"text": extracted_texts})
@@ -150,28 +196,32 @@ def extract_coupons_from_text_tool_func(extracted_texts: List[object]) -> Option
                 if validate_coupon_code(coupon.code):
                     valid_coupons.append(coupon)
             except Exception as e:
-                vprint(f"⚠️ Error validating coupon: {str(e)}")
+                vprint("⚠️ Error validating coupon: %s", e)
                 continue
 
         if valid_coupons:
-            vprint(f"✅ Found {len(valid_coupons)} valid coupons")
+            vprint("✅ Found %s valid coupons", len(valid_coupons))
+            record_coupons(valid_coupons)
             return valid_coupons
         else:
             vprint("⚠️ No valid coupon codes found")
             return []
 
     except Exception as e:
-        vprint(f"❌ Error extracting coupons: {str(e)}")
+        vprint("❌ Error extracting coupons: %s", e)
         return []
 
 
+@traced("extract_form_fields")
 def extract_form_fields_tool_func(html: str) -> Optional[str]:
     vprint("🔍 Starting form field extraction...")
     llm = ChatOpenAI(
         temperature=0,
         openai_api_key=OPENAI_API_KEY,
         model="gpt-4o-mini",
-        model_kwargs={"response_format": {"type": "json_object"}}
+        model_kwargs={"response_format": {"type": "json_object"}},
+        callbacks=[LLMMetricsHandler()],
+        timeout=remaining_timeout(LLM_TIMEOUT)
     )
     chain = EXTRACT_FORM_FIELDS_PROMPT | llm | SimpleJsonOutputParser()
     try:
@@ -187,31 +237,35 @@ def extract_form_fields_tool_func(html: str) -> Optional[str]:
         }
         return json.dumps(form_fields, indent=2)
     except Exception as e:
-        vprint(f"❌ Error in form field extraction: {str(e)}")
+        vprint("❌ Error in form field extraction: %s", e)
         return json.dumps({"form_fields": None})
 
 
+@traced("search_coupons_from_web")
 def search_coupons_from_web_func(merchant_name: str) -> Optional[List[CouponCode]]:
-    vprint(f"🔍 Searching coupons for merchant: {merchant_name}")
+    vprint("🔍 Searching coupons for merchant: %s", merchant_name)
     coupons = []
     vprint("🌐 Starting requests to coupon sites...")
 
     sites = [site.format(merchant_name=merchant_name) for site in COUPON_SITES]
 
     for site in sites:
+        if deadline_expired():
+            vprint("⏱️ Deadline reached, skipping remaining coupon sites")
+            break
         try:
-            vprint(f"📥 Fetching: {site}")
+            vprint("📥 Fetching: %s", site)
             html_content = fetch_url_content(site, COUPON_SEARCH_TIMEOUT)
             if not html_content:
                 continue
 
-            vprint(f"📝 Analyzing content from: {site}")
+            vprint("📝 Analyzing content from: %s", site)
             soup = BeautifulSoup(html_content, 'html.parser')
 
             for selector in COUPON_SELECTORS:
                 elements = soup.select(selector)
-                vprint(
-                    f"🔍 Found {len(elements)} potential coupon elements with selector: {selector}")
+                vprint("🔍 Found %s potential coupon elements with selector: %s",
+                       len(elements), selector)
                 for element in elements:
                     code = None
                     description = None
@@ -221,29 +275,28 @@ def search_coupons_from_web_func(merchant_name: str) -> Optional[List[CouponCode
                         if code_value := element.get(attr):
                             if validate_coupon_code(code_value):
                                 code = code_value.upper()
-                                vprint(
-                                    f"💡 Found code in attribute {attr}: {code}")
+                                vprint("💡 Found code in attribute %s: %s", attr, code)
                                 break
 
                     if not code:
                         text_content = element.get_text(strip=True)
-                        for pattern in CODE_PATTERNS:
-                            if match := re.search(pattern, text_content, re.I):
+                        for matcher in CODE_MATCHERS:
+                            if match := matcher.search(text_content):
                                 potential_code = match.group(1).upper()
                                 if validate_coupon_code(potential_code):
                                     code = potential_code
-                                    vprint(f"💡 Found code in text: {code}")
+                                    vprint("💡 Found code in text: %s", code)
                                     break
 
                     if code and description:
-                        vprint(f"✅ Adding valid coupon: {code}")
+                        vprint("✅ Adding valid coupon: %s", code)
                         coupons.append({
                             'code': code,
                             'source': site,
                         })
 
         except Exception as e:
-            vprint(f"❌ Error processing site {site}: {str(e)}")
+            vprint("❌ Error processing site %s: %s", site, e)
             continue
 
     seen = set()
@@ -253,10 +306,12 @@ def search_coupons_from_web_func(merchant_name: str) -> Optional[List[CouponCode
             seen.add(coupon['code'])
             unique_coupons.append(coupon)
 
-    vprint(f"✨ Found {len(unique_coupons)} unique coupons")
+    vprint("✨ Found %s unique coupons", len(unique_coupons))
+    record_coupons(unique_coupons)
     return json.dumps(unique_coupons)
 
 
+@traced("clean_html")
 def clean_html_tool_func(html: str, tags_to_remove: List[str]) -> str:
     """Clean HTML by removing specified tags"""
     vprint("🧹 Starting HTML cleaning...")
@@ -265,21 +320,21 @@ def clean_html_tool_func(html: str, tags_to_remove: List[str]) -> str:
 
         # Remove specified tags
         for tag in tags_to_remove:
-            vprint(f"Removing {tag} tags...")
+            vprint("Removing %s tags...", tag)
             for element in soup.find_all(tag):
                 element.decompose()
 
         vprint("✅ HTML cleaning completed")
         return str(soup)
     except Exception as e:
-        vprint(f"❌ Error cleaning HTML: {str(e)}")
+        vprint("❌ Error cleaning HTML: %s", e)
         return html
 
 
 scrape_some_images_from_website_tool = StructuredTool(
     name="scrape_some_images_from_website",
     func=scrape_some_images_from_website_tool_func,
-    description="Scrape a website and return a list of image URLs found on the page. Returns a list(array) of image URLs.",
+    description="Scrape a website for coupon codes. If codes are in the page coupon data attributes or embedded JSON state returns an object with those coupons and an empty images list, no OCR is needed then. If codes only appear in the page text returns an object with those coupons and the image URLs, still extract text from the images. Otherwise returns a list(array) of image URLs found on the page.",
     args_schema=ScrapeSomeImagesFromWebsiteInputTool
 )
 
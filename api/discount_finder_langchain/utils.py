@@ -5,29 +5,89 @@ from discount_finder_langchain.prompts import MAIN_PROMPT
 import requests
 import cv2
 import numpy as np
-from typing import List, Dict, Optional, Any
+from typing import Callable, List, Dict, Optional, Any, Tuple
 import json
+import logging
+import os
 import re
+import struct
 from urllib.parse import urlparse
 from discount_finder_langchain.constant import (
     USER_AGENT_HEADERS,
     MIN_IMAGE_WIDTH,
     MIN_IMAGE_HEIGHT,
+    OCR_TARGET_WIDTH,
+    OCR_MIN_SOURCE_WIDTH,
+    DECODABLE_IMAGE_TYPES,
     SCRAPE_TIMEOUT,
+    MAX_HTML_BYTES,
+    MAX_IMAGE_BYTES,
+    FETCH_CHUNK_SIZE,
     OCR_CONFIDENCE_THRESHOLD,
     VALID_COUPON_CODE_PATTERN,
-    MAX_DESCRIPTION_LENGTH
+    MAX_DESCRIPTION_LENGTH,
+    CODE_PATTERNS,
+    KEYWORD_CODE_PATTERNS,
+    ANCHORED_CODE_PATTERNS,
+    EMBEDDED_CODE_PATTERN,
+    NON_CODE_WORDS,
+    COUPON_SELECTORS,
+    COUPON_ATTRIBUTES,
+    GENERIC_COUPON_ATTRIBUTES
 )
 from discount_finder_langchain.config import config
+from discount_finder_langchain.metrics import FETCH_BYTES, HTTP_CACHE_LOOKUPS, record, traced
+from discount_finder_langchain.deadline import deadline_expired, remaining_timeout
+from discount_finder_langchain.http_cache import http_cache
+from urllib3.util.request import ACCEPT_ENCODING
+
+CHARSET_PATTERN = re.compile(r'charset=["\']?([\w.:-]+)', re.I)
+META_CHARSET_PATTERN = re.compile(
+    rb'<meta[^>]+charset=["\']?([\w.:-]+)', re.I)
+
+CODE_MATCHERS = [re.compile(pattern, re.I) for pattern in CODE_PATTERNS]
+KEYWORD_CODE_MATCHERS = [re.compile(pattern, re.I)
+                         for pattern in KEYWORD_CODE_PATTERNS]
+ANCHORED_CODE_MATCHERS = [re.compile(pattern, re.I)
+                          for pattern in ANCHORED_CODE_PATTERNS]
+EMBEDDED_CODE_MATCHER = re.compile(EMBEDDED_CODE_PATTERN, re.I)
+COUPON_ATTRIBUTE_SELECTOR = ", ".join(f"[{attr}]" for attr in COUPON_ATTRIBUTES)
+NON_CODE_WORDS_SET = set(NON_CODE_WORDS)
+SRCSET_DESCRIPTOR_PATTERN = re.compile(r'^(\d+(?:\.\d+)?)([wx])$')
+
+# (factor, flag) from the most to the least reduced
+REDUCED_GRAYSCALE_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+]
+
+logger = logging.getLogger("discount_finder_langchain")
+
+
+def vprint(message: str, *args: Any, level: int = logging.INFO) -> None:
+    """Log message at the given level.
+
+    Arguments are only interpolated when the level is enabled, so pass
+    large payloads as args instead of formatting them up front.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, message, *args)
 
 
-def vprint(message: str) -> None:
-    """Print message only if verbose mode is enabled"""
-    if config.verbose:
-        print(message)
+def rss_bytes() -> int:
+    """Resident set size of the current process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is the peak, in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
 
 
-def create_agent_executor(llm, tools, verbose=True, include_task_in_prompt=True):
+def create_agent_executor(llm, tools, verbose=True, include_task_in_prompt=True,
+                          max_iterations=None, max_execution_time=None):
     input_variables = ["previous_steps", "current_step", "agent_scratchpad"]
     HUMAN_MESSAGE_TEMPLATE = """Previous steps: {previous_steps}
 
@@ -55,67 +115,267 @@ def create_agent_executor(llm, tools, verbose=True, include_task_in_prompt=True)
     )
     agent_executor = AgentExecutor.from_agent_and_tools(
         agent=agent, tools=tools, verbose=verbose,
+        max_iterations=max_iterations, max_execution_time=max_execution_time,
     )
     return ChainExecutor(chain=agent_executor)
 
 
+def _read_capped(response: requests.Response, max_bytes: int) -> Tuple[bytes, bool]:
+    """Read a streamed body, stopping once it grows past max_bytes.
+
+    Returns (body, truncated). The cap applies to decoded bytes, so a small
+    compressed body cannot expand past it either.
+    """
+    body = bytearray()
+    for chunk in response.iter_content(FETCH_CHUNK_SIZE):
+        body.extend(chunk)
+        if len(body) > max_bytes:
+            return bytes(body[:max_bytes]), True
+        if deadline_expired():
+            return bytes(body), True
+    return bytes(body), False
+
+
+def fetch_url_bytes(url: str, timeout: int = SCRAPE_TIMEOUT, max_bytes: int = MAX_HTML_BYTES,
+                    kind: str = "html", allow_truncated: bool = False) -> Optional[Tuple[bytes, Dict[str, str]]]:
+    """Fetch a URL through the HTTP cache with a hard size cap.
+
+    Returns (body, headers), or None on error. Bodies over max_bytes are
+    returned cut short when allow_truncated is set and dropped otherwise.
+    """
+    cached = http_cache.get(url) if config.http_cache_enabled else None
+    if cached is not None and cached.is_fresh():
+        HTTP_CACHE_LOOKUPS.inc(kind=kind, result="fresh")
+        return cached.body, cached.headers
+
+    headers = {**USER_AGENT_HEADERS, "Accept-Encoding": ACCEPT_ENCODING}
+    if cached is not None:
+        headers.update(cached.conditional_headers())
+
+    with requests.get(url, headers=headers, timeout=remaining_timeout(timeout), stream=True) as response:
+        if response.status_code == 304 and cached is not None:
+            HTTP_CACHE_LOOKUPS.inc(kind=kind, result="revalidated")
+            http_cache.touch(url)
+            return cached.body, cached.headers
+        response.raise_for_status()
+
+        body, truncated = _read_capped(response, max_bytes)
+        FETCH_BYTES.inc(len(body), kind=kind)
+        record("bytes_fetched", len(body))
+        HTTP_CACHE_LOOKUPS.inc(kind=kind, result="miss")
+        if truncated:
+            vprint("✂️ Stopped reading %s at %s bytes", url, len(body))
+            return (body, response.headers) if allow_truncated else None
+        if config.http_cache_enabled:
+            http_cache.put(url, response.headers, body)
+        return body, response.headers
+
+
+def decode_html(body: bytes, content_type: str = "") -> str:
+    """Decode HTML using the declared charset, sniffing only when there is none."""
+    charset = CHARSET_PATTERN.search(content_type)
+    if not charset:
+        charset = META_CHARSET_PATTERN.search(body[:2048])
+    encoding = charset.group(1) if charset else "utf-8"
+    if isinstance(encoding, bytes):
+        encoding = encoding.decode("ascii", "ignore")
+    try:
+        return body.decode(encoding, errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+@traced("fetch_url_content")
 def fetch_url_content(url: str, timeout: int = SCRAPE_TIMEOUT) -> Optional[str]:
     """Fetch content from a URL with error handling."""
     try:
-        response = requests.get(
-            url, headers=USER_AGENT_HEADERS, timeout=timeout)
-        response.raise_for_status()
-        return response.text
+        result = fetch_url_bytes(url, timeout, MAX_HTML_BYTES,
+                                 kind="html", allow_truncated=True)
+        if result is None:
+            return None
+        body, headers = result
+        return decode_html(body, headers.get("Content-Type", ""))
     except Exception as e:
-        vprint(f"❌ Error fetching URL {url}: {str(e)}")
+        vprint("❌ Error fetching URL %s: %s", url, e)
         return None
 
 
-def process_image_for_ocr(image_content: bytes) -> Optional[np.ndarray]:
-    """Process image bytes into a format suitable for OCR."""
+@traced("fetch_image")
+def fetch_image(url: str, timeout: int = SCRAPE_TIMEOUT) -> Optional[bytes]:
+    """Download an image for OCR, None if it fails or is over the size cap."""
     try:
+        result = fetch_url_bytes(url, timeout, MAX_IMAGE_BYTES, kind="image")
+        return result[0] if result else None
+    except Exception as e:
+        vprint("❌ Error fetching image %s: %s", url, e)
+        return None
+
+
+def image_dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from a PNG, GIF or JPEG header without decoding."""
+    try:
+        if data[:8] == b"\x89PNG\r\n\x1a\n":
+            return struct.unpack(">II", data[16:24])
+        if data[:6] in (b"GIF87a", b"GIF89a"):
+            return struct.unpack("<HH", data[6:10])
+        if data[:2] == b"\xff\xd8":
+            i = 2
+            while i + 9 < len(data):
+                if data[i] != 0xFF:
+                    i += 1
+                    continue
+                marker = data[i + 1]
+                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack(">HH", data[i + 5:i + 9])
+                    return width, height
+                if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                    i += 2
+                    continue
+                i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    except struct.error:
+        pass
+    return None
+
+
+def _grayscale_decode_flag(width: Optional[int]) -> int:
+    """Pick the largest reduction that keeps the image at least OCR_TARGET_WIDTH wide."""
+    if width:
+        for factor, flag in REDUCED_GRAYSCALE_FLAGS:
+            if width // factor >= OCR_TARGET_WIDTH:
+                return flag
+    return cv2.IMREAD_GRAYSCALE
+
+
+@traced("process_image_for_ocr")
+def process_image_for_ocr(image_content: bytes,
+                          allocate: Optional[Callable[[Tuple[int, ...]], np.ndarray]] = None) -> Optional[np.ndarray]:
+    """Process image bytes into a format suitable for OCR.
+
+    Images are decoded straight to grayscale, at reduced scale when they are
+    much wider than OCR needs. `allocate(shape)` may supply the output array,
+    e.g. a reused buffer or shared memory the OCR sidecar reads directly.
+    """
+    try:
+        dimensions = image_dimensions(image_content)
+        flag = _grayscale_decode_flag(dimensions[0] if dimensions else None)
         nparr = np.frombuffer(image_content, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        gray = cv2.imdecode(nparr, flag)
+        out = allocate(gray.shape) if allocate else None
         enhanced = cv2.adaptiveThreshold(
-            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2, dst=out)
         return enhanced
     except Exception as e:
-        vprint(f"❌ Error processing image: {str(e)}")
+        vprint("❌ Error processing image: %s", e)
         return None
 
 
-def filter_image_by_size(img_tag: Any, base_url: str) -> Optional[str]:
-    """Filter and process image tags based on size requirements."""
-    try:
-        src = img_tag.get('src', '') or img_tag.get(
-            'data-src', '') or img_tag.get('data-lazy-src', '')
-        if not src or not src.strip() or src.startswith('data:'):
-            return None
+def _absolute_url(src: str, base_url: str) -> str:
+    if src.startswith('//'):
+        return 'https:' + src
+    if src.startswith('/'):
+        return f'https://{base_url}{src}'
+    if not src.startswith(('http://', 'https://')):
+        return f'https://{base_url}/{src}'
+    return src
+
+
+def parse_srcset(srcset: str) -> List[Tuple[str, Optional[float], Optional[str]]]:
+    """Parse a srcset attribute into (url, value, unit) with unit 'w', 'x' or None."""
+    candidates = []
+    tokens = srcset.split()
+    i = 0
+    while i < len(tokens):
+        url = tokens[i]
+        i += 1
+        descriptor = None
+        if url.endswith(','):
+            url = url.rstrip(',')
+        elif i < len(tokens):
+            descriptor = tokens[i]
+            i += 1
+            # "a.jpg 1x,b.jpg 2x" leaves the next URL glued to the descriptor
+            if ',' in descriptor:
+                descriptor, rest = descriptor.split(',', 1)
+                if rest:
+                    tokens.insert(i, rest)
+        if not url or url.startswith('data:'):
+            continue
+        match = SRCSET_DESCRIPTOR_PATTERN.match(descriptor or '')
+        if match:
+            candidates.append((url, float(match.group(1)), match.group(2)))
+        else:
+            candidates.append((url, None, None))
+    return candidates
+
+
+def select_srcset_candidate(candidates: List[Tuple[str, Optional[float], Optional[str]]],
+                            display_width: Optional[int]) -> Optional[str]:
+    """Smallest candidate at least OCR_MIN_SOURCE_WIDTH wide, else the largest."""
+    sized = []
+    for url, value, unit in candidates:
+        if unit == 'w':
+            sized.append((value, url))
+        elif display_width:
+            sized.append((display_width * (value or 1), url))
+    if sized:
+        sized.sort()
+        for width, url in sized:
+            if width >= OCR_MIN_SOURCE_WIDTH:
+                return url
+        return sized[-1][1]
+    # Only density descriptors and no known display width, take the lowest
+    if candidates:
+        return min(candidates, key=lambda c: c[1] or 1)[0]
+    return None
+
+
+def _srcset_candidates(img_tag: Any) -> List[Tuple[str, Optional[float], Optional[str]]]:
+    candidates = []
+    for attr in ('srcset', 'data-srcset'):
+        if srcset := img_tag.get(attr):
+            candidates.extend(parse_srcset(srcset))
+    picture = img_tag.parent
+    if picture is not None and picture.name == 'picture':
+        for source in picture.find_all('source'):
+            if source.get('type') and source['type'] not in DECODABLE_IMAGE_TYPES:
+                continue
+            if srcset := source.get('srcset') or source.get('data-srcset'):
+                candidates.extend(parse_srcset(srcset))
+    return candidates
 
-        # Handle relative URLs
-        if src.startswith('//'):
-            src = 'https:' + src
-        elif src.startswith('/'):
-            src = f'https://{base_url}{src}'
-        elif not src.startswith(('http://', 'https://')):
-            src = f'https://{base_url}/{src}'
 
+def filter_image_by_size(img_tag: Any, base_url: str) -> Optional[str]:
+    """Filter and process image tags based on size requirements.
+
+    When the tag (or its <picture>) offers a srcset, the smallest variant
+    that is still large enough for OCR is chosen over `src`.
+    """
+    try:
         width = img_tag.get('width', '').strip(
             'px') or img_tag.get('data-width', '').strip('px')
         height = img_tag.get('height', '').strip(
             'px') or img_tag.get('data-height', '').strip('px')
 
+        display_width = None
         if width and height:
             try:
                 if int(width) < MIN_IMAGE_WIDTH or int(height) < MIN_IMAGE_HEIGHT:
                     return None
+                display_width = int(width)
             except ValueError:
                 pass
 
-        return src
+        src = select_srcset_candidate(_srcset_candidates(img_tag), display_width)
+        if not src:
+            src = img_tag.get('src', '') or img_tag.get(
+                'data-src', '') or img_tag.get('data-lazy-src', '')
+        if not src or not src.strip() or src.startswith('data:'):
+            return None
+
+        # Handle relative URLs
+        return _absolute_url(src.strip(), base_url)
     except Exception as e:
-        vprint(f"⚠️ Error processing image tag: {str(e)}")
+        vprint("⚠️ Error processing image tag: %s", e)
         return None
 
 
@@ -126,7 +386,7 @@ def extract_base_url(url: str) -> Optional[str]:
         base_url = parsed_url.netloc
         return base_url if base_url else None
     except Exception as e:
-        vprint(f"⚠️ Error extracting base URL: {str(e)}")
+        vprint("⚠️ Error extracting base URL: %s", e)
         return None
 
 
@@ -142,7 +402,7 @@ def process_ocr_detection(detection: List[Any]) -> Optional[Dict[str, Any]]:
             }
         return None
     except Exception as e:
-        vprint(f"❌ Error processing OCR detection: {str(e)}")
+        vprint("❌ Error processing OCR detection: %s", e)
         return None
 
 
@@ -153,6 +413,88 @@ def validate_coupon_code(code: str) -> bool:
     return bool(re.match(VALID_COUPON_CODE_PATTERN, code.strip(), re.I))
 
 
+def _looks_like_code(candidate: str, require_digit: bool = False) -> bool:
+    """Stricter check for codes read from the page, where false positives are cheap to make.
+
+    All-digit tokens such as years, prices or lengths never count.
+    """
+    if not validate_coupon_code(candidate) or candidate != candidate.upper():
+        return False
+    if candidate.isdigit():
+        return False
+    if candidate in NON_CODE_WORDS_SET:
+        return False
+    return not require_digit or any(c.isdigit() for c in candidate)
+
+
+def _free_text_codes(text: str, matchers: List[re.Pattern]) -> List[str]:
+    """Codes the matchers find in free text.
+
+    A keyword alone ("coupon terms", "promo details") is weak evidence, so a
+    candidate needs a digit unless written as "code: X" or "use code X".
+    """
+    anchored = {match.group(1).upper()
+                for matcher in ANCHORED_CODE_MATCHERS for match in matcher.finditer(text)}
+    codes = []
+    for matcher in matchers:
+        for match in matcher.finditer(text):
+            candidate = match.group(1)
+            if _looks_like_code(candidate, require_digit=candidate.upper() not in anchored):
+                codes.append(candidate)
+    return codes
+
+
+@traced("find_coupons_in_html")
+def find_coupons_in_html(html: str, soup: Any, url: str) -> Tuple[List[Dict[str, str]], bool]:
+    """Find coupon codes that are already in the page without running OCR.
+
+    Looks at coupon data attributes, coupon code keys in embedded JSON or
+    JS state (__NEXT_DATA__, ld+json, window.__STATE__), text inside
+    coupon-like elements and keyword-anchored codes in the visible text.
+
+    Returns (coupons, conclusive). Only attribute and embedded JSON hits are
+    conclusive, codes read from free text do not make image OCR unnecessary.
+    """
+    found: Dict[str, str] = {}
+
+    def add(code: str, where: str) -> None:
+        code = code.strip().upper()
+        if code not in found:
+            found[code] = f"{where} on {url}"
+
+    coupon_elements = soup.select(", ".join(COUPON_SELECTORS))
+    coupon_ids = {id(element) for element in coupon_elements}
+
+    for element in soup.select(COUPON_ATTRIBUTE_SELECTOR):
+        in_coupon = None
+        for attr in COUPON_ATTRIBUTES:
+            value = (element.get(attr) or "").strip()
+            if not _looks_like_code(value):
+                continue
+            if attr in GENERIC_COUPON_ATTRIBUTES:
+                if in_coupon is None:
+                    in_coupon = id(element) in coupon_ids or any(
+                        id(parent) in coupon_ids for parent in element.parents)
+                if not in_coupon:
+                    continue
+            add(value, f"{attr} attribute")
+
+    for match in EMBEDDED_CODE_MATCHER.finditer(html):
+        if _looks_like_code(match.group(2)):
+            add(match.group(2), f"embedded {match.group(1)}")
+
+    conclusive = bool(found)
+
+    for element in coupon_elements:
+        for code in _free_text_codes(element.get_text(" ", strip=True), CODE_MATCHERS):
+            add(code, "coupon banner text")
+
+    for code in _free_text_codes(soup.get_text(" ", strip=True), KEYWORD_CODE_MATCHERS):
+        add(code, "page text")
+
+    return [{"code": code, "source": source} for code, source in found.items()], conclusive
+
+
 def clean_description(description: str) -> str:
     """Clean and truncate description text."""
     if not description:
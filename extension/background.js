@@ -44,19 +44,31 @@ async function getCachedResponse(url, type) {
   const cached = await browser.storage.local.get(cacheKey);
 
   if (cached[cacheKey]) {
-    const { data, timestamp } = cached[cacheKey];
+    const { data, timestamp, etag } = cached[cacheKey];
     if (Date.now() - timestamp < CACHE_DURATION) {
       console.log(`Using cached ${type} response for domain: ${domain}`);
       return data;
     }
-    // Cache expired, remove it
-    await browser.storage.local.remove(cacheKey);
+    // Cache expired, keep entries with an ETag so the server can revalidate them
+    if (!etag) {
+      await browser.storage.local.remove(cacheKey);
+    }
     analyzedDomains.delete(domain);
   }
   return null;
 }
 
-async function setCachedResponse(url, type, data) {
+// Expired entry with its ETag, used for a conditional request
+async function getStaleResponse(url, type) {
+  const domain = extractDomain(url);
+  if (!domain) return null;
+
+  const cacheKey = `${type}_${domain}`;
+  const cached = await browser.storage.local.get(cacheKey);
+  return cached[cacheKey]?.etag ? cached[cacheKey] : null;
+}
+
+async function setCachedResponse(url, type, data, etag = null) {
   const domain = extractDomain(url);
   if (!domain) return;
 
@@ -64,6 +76,7 @@ async function setCachedResponse(url, type, data) {
   await browser.storage.local.set({
     [cacheKey]: {
       data,
+      etag,
       timestamp: Date.now()
     }
   });
@@ -124,6 +137,47 @@ function debounce(func, wait) {
 }
 
 const API_BASE_URL = 'http://localhost:8000';
+// How long we wait for the API, the server stops work once this passes
+const ANALYZE_DEADLINE_MS = 20 * 1000;
+const FORM_DEADLINE_MS = 15 * 1000;
+// Extra time for the partial result to reach us after the server deadline
+const DEADLINE_GRACE_MS = 2 * 1000;
+
+// Request bodies above this are gzipped before upload
+const COMPRESS_MIN_BYTES = 8 * 1024;
+
+async function gzipBody(text) {
+  const stream = new Blob([text]).stream().pipeThrough(new CompressionStream('gzip'));
+  return await new Response(stream).arrayBuffer();
+}
+
+// POST JSON with a deadline the server is told about and the client enforces.
+// An etag makes the request conditional, the server answers 304 if it still matches.
+async function postWithDeadline(path, body, deadlineMs, { etag = null } = {}) {
+  const controller = new AbortController();
+  const timer = setTimeout(() => controller.abort(), deadlineMs + DEADLINE_GRACE_MS);
+  const headers = {
+    'Content-Type': 'application/json',
+  };
+  if (etag) {
+    headers['If-None-Match'] = etag;
+  }
+  let payload = JSON.stringify({ ...body, deadline_seconds: deadlineMs / 1000 });
+  if (payload.length > COMPRESS_MIN_BYTES && typeof CompressionStream !== 'undefined') {
+    payload = await gzipBody(payload);
+    headers['Content-Encoding'] = 'gzip';
+  }
+  try {
+    return await fetch(`${API_BASE_URL}${path}`, {
+      method: 'POST',
+      headers,
+      body: payload,
+      signal: controller.signal
+    });
+  } finally {
+    clearTimeout(timer);
+  }
+}
 const ECOMMERCE_PATTERNS = [
   'checkout',
   'cart',
@@ -180,13 +234,15 @@ async function analyzePage(url) {
       return cachedResponse;
     }
 
-    const response = await fetch(`${API_BASE_URL}/analyze`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({ url })
-    });
+    const stale = await getStaleResponse(url, 'page');
+    const response = await postWithDeadline('/analyze', { url }, ANALYZE_DEADLINE_MS,
+      { etag: stale?.etag });
+
+    if (response.status === 304) {
+      await setCachedResponse(url, 'page', stale.data, stale.etag);
+      markDomainAnalyzed(url);
+      return stale.data;
+    }
 
     if (!response.ok) {
       throw new Error(`HTTP error! status: ${response.status}`);
@@ -197,13 +253,15 @@ async function analyzePage(url) {
       coupons: Array.isArray(result.coupons) ? result.coupons : []
     };
 
-    // Cache the response and store domain coupons
-    await setCachedResponse(url, 'page', formattedResult);
     if (formattedResult.coupons.length > 0) {
       await storeDomainCoupons(url, formattedResult.coupons);
     }
 
-    markDomainAnalyzed(url);
+    // Partial results are used but not cached, so the next visit retries
+    if (!result.incomplete) {
+      await setCachedResponse(url, 'page', formattedResult, response.headers.get('ETag'));
+      markDomainAnalyzed(url);
+    }
     return formattedResult;
   } catch (error) {
     console.error('Error analyzing page:', error);
@@ -211,6 +269,82 @@ async function analyzePage(url) {
   }
 }
 
+// Last page uploaded to /analyze_form per domain, the base for the next delta
+const lastFormUploads = new Map();
+// A delta is sent only when its inserted text is below this share of the page
+const MAX_DELTA_RATIO = 0.5;
+
+// Same normalization as the server: collapse ASCII whitespace runs, trim spaces
+function normalizeHtml(html) {
+  return html.replace(/[ \t\n\r\f]+/g, ' ').replace(/^ | $/g, '');
+}
+
+async function sha256Hex(text) {
+  const digest = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(text));
+  return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+}
+
+function isHighSurrogate(code) {
+  return code >= 0xd800 && code <= 0xdbff;
+}
+
+function isLowSurrogate(code) {
+  return code >= 0xdc00 && code <= 0xdfff;
+}
+
+// Copy/skip/insert ops around the changed middle, lengths in UTF-16 code units
+function computeDelta(base, html) {
+  const max = Math.min(base.length, html.length);
+  let prefix = 0;
+  while (prefix < max && base.charCodeAt(prefix) === html.charCodeAt(prefix)) {
+    prefix++;
+  }
+  // Never split a surrogate pair, the server rejects a lone half in the inserted text
+  if (prefix && isHighSurrogate(html.charCodeAt(prefix - 1))) prefix--;
+  let suffix = 0;
+  while (suffix < max - prefix &&
+    base.charCodeAt(base.length - 1 - suffix) === html.charCodeAt(html.length - 1 - suffix)) {
+    suffix++;
+  }
+  if (suffix && isLowSurrogate(html.charCodeAt(html.length - suffix))) suffix--;
+  const ops = [];
+  if (prefix) ops.push({ op: '=', length: prefix });
+  if (base.length - prefix - suffix) ops.push({ op: '-', length: base.length - prefix - suffix });
+  if (html.length - prefix - suffix) ops.push({ op: '+', text: html.slice(prefix, html.length - suffix) });
+  if (suffix) ops.push({ op: '=', length: suffix });
+  return ops;
+}
+
+// Send the page hash first, then a delta or the full page only if the server asks
+async function uploadFormHtml(domain, html, etag) {
+  const normalized = normalizeHtml(html);
+  const htmlHash = await sha256Hex(normalized);
+  const post = body => postWithDeadline('/analyze_form', { html_hash: htmlHash, ...body },
+    FORM_DEADLINE_MS, { etag });
+
+  let response = await post({});
+  if (!response.ok || !(await response.clone().json()).html_required) {
+    return response;
+  }
+
+  const previous = lastFormUploads.get(domain);
+  if (previous) {
+    const delta = computeDelta(previous.html, normalized);
+    const inserted = delta.reduce((total, op) => total + (op.text?.length || 0), 0);
+    if (inserted < normalized.length * MAX_DELTA_RATIO) {
+      response = await post({ base_hash: previous.hash, html_delta: delta });
+    }
+  }
+  // Anything but a result or a 304 for the delta falls back to the full page
+  if (response.status !== 304 && (!response.ok || (await response.clone().json()).html_required)) {
+    response = await post({ html_page: normalized });
+  }
+  if (response.ok) {
+    lastFormUploads.set(domain, { hash: htmlHash, html: normalized });
+  }
+  return response;
+}
+
 // Analyze form fields
 async function analyzeForm(html, url) {
   try {
@@ -223,13 +357,13 @@ async function analyzeForm(html, url) {
       return cachedResponse;
     }
 
-    const response = await fetch(`${API_BASE_URL}/analyze_form`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({ html_page: html })
-    });
+    const stale = await getStaleResponse(url, 'form');
+    const response = await uploadFormHtml(domain, html, stale?.etag);
+
+    if (response.status === 304) {
+      await setCachedResponse(url, 'form', stale.data, stale.etag);
+      return stale.data;
+    }
 
     if (!response.ok) {
       throw new Error(`HTTP error! status: ${response.status}`);
@@ -241,7 +375,7 @@ async function analyzeForm(html, url) {
     }
 
     // Cache the response
-    await setCachedResponse(url, 'form', result);
+    await setCachedResponse(url, 'form', result, response.headers.get('ETag'));
 
     return result;
   } catch (error) {